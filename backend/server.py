@@ -1,10 +1,14 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, Query, Request, UploadFile, File, Form, status
+from fastapi.encoders import jsonable_encoder
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
 import os
+import socket
+import asyncio
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
@@ -16,24 +20,110 @@ from jose import JWTError, jwt
 from config import COMPANY_CONFIG, PRICING_MULTIPLIER, MINIMUM_ORDER_QUANTITY, GST_RATE, CARD_SURCHARGE_RATE
 from utils.gst_validator import validate_gst_number, validate_quantity
 from utils.invoice_generator import generate_invoice_pdf
-from utils.notifications import generate_whatsapp_link, create_order_notification_message, send_email_notification
+from utils.notifications import generate_whatsapp_link, create_order_notification_message, send_email_notification, create_dispatch_manifest_message
+from utils.dispatch_planner import plan_dispatch, order_bags
+from utils.order_events import OrderEventBroker, order_event, stream_order_events, watch_order_changes
+from utils.idempotency import IdempotencyStore, IdempotencyConflict, IdempotencyKeyReused, request_fingerprint
+from utils.order_archive import ensure_archive_indexes, find_order, find_orders, get_archive_stats, archive_closed_orders
+from utils.analytics_snapshot import AnalyticsSnapshot, GROUP_DIMENSIONS, revenue_breakdown
+from utils.profiling import MongoCommandRecorder, ProfiledDatabase, ProfilingMiddleware, list_profiles, load_profile, prune_profiles
+from utils.order_search import ensure_search_indexes, backfill_search_fields, search_orders, user_search_fields
+from utils.invoice_numbers import InvoiceNumberAllocator, invoice_file_name
+from utils.scheduler import MaintenanceScheduler
+from utils.maintenance import ensure_maintenance_indexes, cart_expiry, backfill_cart_expiry, remove_orphaned_invoices, collection_stats
+from utils.demand_rollup import ensure_demand_indexes, record_request_created, record_status_change, status_change_operation, rebuild_demand_rollups
+from utils.single_flight import SingleFlight
+from utils.file_responses import conditional_file_response
+from utils.loop_monitor import LoopLagMonitor
+from utils.bulk_import import catalog_frame, read_order_lines
+from utils.invalidation import InvalidationBus
+from utils.compression import CompressionMiddleware, PrecompressedCache
+from utils.order_index import OrderIndex, ORDER_INDEX_PROJECTION, created_ms
+from utils.structured_logging import RequestLogMiddleware, bind_log_context, dropped_log_records, parse_sample_rates, setup_logging
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Only profiled requests (one at a time) go through the monitored client
+profiled_client = AsyncIOMotorClient(mongo_url, event_listeners=[MongoCommandRecorder()], maxPoolSize=4)
+db = ProfiledDatabase(client[os.environ['DB_NAME']], profiled_client[os.environ['DB_NAME']])
 
 app = FastAPI()
 api_router = APIRouter(prefix="/api")
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
 SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'your-secret-key-change-in-production')
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 43200
+STREAM_TOKEN_EXPIRE_SECONDS = 60
+STREAM_TOKEN_SCOPE = "order_events"
+
+# Admin request profiling (X-Profile: 1 header or a sampled share of requests)
+PROFILE_DIR = os.environ.get('PROFILE_DIR', '/app/profiles')
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_RETENTION_DAYS = float(os.environ.get('PROFILE_RETENTION_DAYS', 7))
+
+# Stalls longer than this are logged with the blocking stack and counted per route
+loop_monitor = LoopLagMonitor(threshold_ms=float(os.environ.get('LOOP_LAG_THRESHOLD_MS', 100)))
+
+# "local" publishes order events in-process; "change_stream" tails MongoDB so all workers see them
+ORDER_EVENTS_SOURCE = os.environ.get('ORDER_EVENTS_SOURCE', 'local')
+order_events = OrderEventBroker()
+
+# Columnar copy of the live orders for admin filtering; kept current from order writes and events
+order_index = OrderIndex()
+# Writes reach the other workers' copies over the invalidation bus ("orders" topic). As a
+# safety net, new orders are re-read every refresh and the whole index is rebuilt rarely,
+# since every worker reads the whole collection for it
+ORDER_INDEX_REFRESH_SECONDS = int(os.environ.get('ORDER_INDEX_REFRESH_SECONDS', 300))
+ORDER_INDEX_REBUILD_HOURS = float(os.environ.get('ORDER_INDEX_REBUILD_HOURS', 6))
+# Orders are stamped before they are inserted, so each refresh re-reads a short window
+ORDER_INDEX_LOOKBACK_SECONDS = 600
+order_index_rebuilds = asyncio.Lock()
+
+# Cross-worker cache invalidation: "tail" (capped collection), "change_stream" or "poll"
+invalidation_bus = InvalidationBus(
+    db,
+    source=os.environ.get('INVALIDATION_SOURCE', 'tail'),
+    poll_interval=float(os.environ.get('INVALIDATION_POLL_SECONDS', 1))
+)
+
+# Closed orders older than this move to orders_archive
+ORDER_ARCHIVE_AFTER_DAYS = int(os.environ.get('ORDER_ARCHIVE_AFTER_DAYS', 180))
+ORDER_ARCHIVE_INTERVAL_HOURS = float(os.environ.get('ORDER_ARCHIVE_INTERVAL_HOURS', 24))
+
+# Columnar order-line snapshot behind /admin/analytics/breakdown
+analytics_snapshot = AnalyticsSnapshot(os.environ.get('ANALYTICS_SNAPSHOT_DIR', '/app/analytics'))
+ANALYTICS_REFRESH_MINUTES = float(os.environ.get('ANALYTICS_REFRESH_MINUTES', 15))
+
+# Carts untouched for this long are removed by a TTL index
+CART_TTL_DAYS = int(os.environ.get('CART_TTL_DAYS', 30))
+INVOICE_DIR = "/app/invoices"
+
+maintenance = MaintenanceScheduler(db.locks)
+
+# Sequential GST invoice numbers, reserved from db.counters in blocks per worker
+invoice_allocator = InvoiceNumberAllocator(db.counters, block_size=int(os.environ.get('INVOICE_NUMBER_BLOCK_SIZE', 20)))
+# In-flight invoice renders by order id, so two requests never write the same PDF at once
+invoice_renders = SingleFlight()
+
+idempotency_store = IdempotencyStore(db.idempotency_keys, ttl_seconds=int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', 86400)))
+
+# User projections, one per purpose, so hot paths never load password hashes
+USER_PRINCIPAL_PROJECTION = {"_id": 0, "password": 0, "addresses": 0}
+USER_CONTACT_PROJECTION = {"_id": 0, "id": 1, "name": 1, "role": 1, "phone": 1}
+USER_INVOICE_PROJECTION = {"_id": 0, "id": 1, "name": 1, "role": 1, "phone": 1, "businessName": 1, "isGstRegistered": 1, "gstNumber": 1}
+
+# Delivery statuses that notify the customer
+DELIVERY_EVENTS = {
+    "out_for_delivery": "out_for_delivery",
+    "delivered": "delivered"
+}
 
 # Models
 class Address(BaseModel):
@@ -125,6 +215,7 @@ class Order(BaseModel):
     driverMobile: Optional[str] = None
     vehicleNumber: Optional[str] = None
     deliveryStatus: Optional[str] = None
+    invoiceNumber: Optional[str] = None
     invoicePath: Optional[str] = None
     createdAt: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
 
@@ -154,6 +245,30 @@ class RequestOrderCreate(BaseModel):
     phone: str
     preferredDate: str
 
+class Vehicle(BaseModel):
+    driverName: str
+    driverMobile: str
+    vehicleNumber: str
+    capacity: int
+
+class DispatchPlanRequest(BaseModel):
+    vehicles: List[Vehicle]
+    orderIds: Optional[List[str]] = None
+    apply: bool = True
+
+class PaymentStatusUpdate(BaseModel):
+    orderId: str
+    paymentStatus: str
+    transactionId: Optional[str] = None
+
+class DeliveryStatusUpdate(BaseModel):
+    orderId: str
+    deliveryStatus: str
+
+class RequestStatusUpdate(BaseModel):
+    requestId: str
+    status: str
+
 # Helper functions
 def get_password_hash(password: str):
     return pwd_context.hash(password)
@@ -161,27 +276,182 @@ def get_password_hash(password: str):
 def verify_password(plain_password: str, hashed_password: str):
     return pwd_context.verify(plain_password, hashed_password)
 
-def create_access_token(data: dict):
+def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
-    expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    expire = datetime.now(timezone.utc) + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+async def get_user_from_token(token: str, scope: Optional[str] = None):
     try:
-        token = credentials.credentials
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: str = payload.get("sub")
-        if user_id is None:
+        # Scoped tokens only open what they were issued for; session tokens carry no scope
+        if user_id is None or payload.get("scope") != scope:
             raise HTTPException(status_code=401, detail="Invalid authentication credentials")
-        user = await db.users.find_one({"id": user_id}, {"_id": 0})
+        user = await db.users.find_one({"id": user_id}, USER_PRINCIPAL_PROJECTION)
         if user is None:
             raise HTTPException(status_code=401, detail="User not found")
+        bind_log_context(userId=user_id)
         return User(**user)
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid authentication credentials")
 
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    return await get_user_from_token(credentials.credentials)
+
+async def get_stream_user(token: Optional[str] = None, credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)):
+    # EventSource cannot send headers, so streams also accept ?token=. Query strings
+    # end up in access logs, so only a short-lived stream token is taken there.
+    if credentials:
+        return await get_user_from_token(credentials.credentials)
+    if not token:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return await get_user_from_token(token, scope=STREAM_TOKEN_SCOPE)
+
+# Order ids written since the last "orders" publication, sent once per loop tick
+shared_order_changes = set()
+
+def share_order_changes(order_ids):
+    """
+    Have every other worker re-read these orders' index rows
+    """
+    if not shared_order_changes:
+        task = asyncio.get_running_loop().create_task(publish_shared_order_changes())
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+    shared_order_changes.update(order_ids)
+
+async def publish_shared_order_changes():
+    # Let the rest of a bulk update queue its ids first
+    await asyncio.sleep(0)
+    order_ids = list(shared_order_changes)
+    shared_order_changes.clear()
+    try:
+        await invalidation_bus.publish("orders", order_ids)
+    except Exception as e:
+        logger.warning(f"Could not share order index changes: {str(e)}")
+
+def publish_order_event(order_id: str, user_id: str, changes: dict):
+    order_index.apply_changes(order_id, changes)
+    share_order_changes([order_id])
+    # With a change stream source, MongoDB delivers the event to every worker instead
+    if ORDER_EVENTS_SOURCE == "local":
+        event = order_event(order_id, user_id, changes)
+        if event["changes"]:
+            order_events.publish(event)
+
+async def run_idempotent(idempotency_key: Optional[str], scope: str, payload, handler):
+    """
+    Run handler once per Idempotency-Key; replays return the stored response
+    """
+    if not idempotency_key:
+        return await handler()
+    
+    key = f"{scope}:{idempotency_key}"
+    try:
+        record = await idempotency_store.begin(key, request_fingerprint(jsonable_encoder(payload)))
+    except IdempotencyConflict:
+        raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is already in progress")
+    except IdempotencyKeyReused:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+    if record:
+        return JSONResponse(status_code=record["statusCode"], content=record["response"], headers={"Idempotent-Replayed": "true"})
+    
+    try:
+        result = await handler()
+    except BaseException:
+        # Includes CancelledError from a dropped client, which is not an Exception
+        await idempotency_store.release(key)
+        raise
+    await idempotency_store.complete(key, 200, jsonable_encoder(result))
+    return result
+
+def is_profile_id(profile_id: str) -> bool:
+    try:
+        return uuid.UUID(hex=profile_id).hex == profile_id
+    except ValueError:
+        return False
+
+def cart_timestamps() -> dict:
+    return {"updatedAt": datetime.now(timezone.utc).isoformat(), "expiresAt": cart_expiry(CART_TTL_DAYS)}
+
+def generate_order_invoice(order: dict, user: dict) -> str:
+    invoice_dir = Path(INVOICE_DIR)
+    invoice_dir.mkdir(exist_ok=True)
+    invoice_path = str(invoice_dir / invoice_file_name(order["invoiceNumber"]))
+    generate_invoice_pdf(order, user, order["items"], invoice_path)
+    return invoice_path
+
+async def issue_order_invoice(order: dict, user: dict, orders_collection=None) -> str:
+    """
+    Give the order its sequential invoice number (once) and render the PDF
+    """
+    orders_collection = orders_collection if orders_collection is not None else db.orders
+    if not order.get("invoiceNumber"):
+        # Number from the financial year of the date printed on the invoice
+        invoice_number = await invoice_allocator.allocate(datetime.fromisoformat(order["createdAt"]))
+        result = await orders_collection.update_one({"id": order["id"], "invoiceNumber": None}, {"$set": {"invoiceNumber": invoice_number}})
+        if result.matched_count == 0:
+            # Another request numbered this order first; keep the series gap-free
+            await invoice_allocator.give_back(invoice_number)
+            numbered = await orders_collection.find_one({"id": order["id"]}, {"_id": 0, "invoiceNumber": 1})
+            invoice_number = numbered["invoiceNumber"]
+        order["invoiceNumber"] = invoice_number
+    return await asyncio.to_thread(generate_order_invoice, order, user)
+
+async def render_missing_invoice(order_id: str) -> str:
+    """
+    Re-render an invoice whose PDF is gone from disk (e.g. after a redeploy)
+    """
+    orders_collection = db.orders
+    order = await db.orders.find_one({"id": order_id}, {"_id": 0})
+    if order is None:
+        orders_collection = db.orders_archive
+        order = await db.orders_archive.find_one({"id": order_id}, {"_id": 0})
+    if order is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    # Another download may have rendered it while we waited on the lookup
+    if order.get("invoicePath") and os.path.exists(order["invoicePath"]):
+        return order["invoicePath"]
+
+    user = await db.users.find_one({"id": order["userId"]}, USER_INVOICE_PROJECTION)
+    if not user:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    invoice_path = await issue_order_invoice(order, user, orders_collection)
+    if invoice_path != order.get("invoicePath"):
+        await orders_collection.update_one({"id": order_id}, {"$set": {"invoicePath": invoice_path}})
+    return invoice_path
+
+# Product catalog frame used to validate bulk imports, dropped whenever any worker changes a product
+catalog_cache = {"version": 0, "frame": None}
+
+def evict_catalog(keys):
+    catalog_cache["version"] += 1
+    catalog_cache["frame"] = None
+
+invalidation_bus.subscribe("products", evict_catalog)
+
+# Rendered /products and /config bodies with their compressed variants
+response_cache = PrecompressedCache()
+invalidation_bus.subscribe("products", lambda keys: response_cache.evict("products"))
+invalidation_bus.subscribe("config", lambda keys: response_cache.evict("config"))
+
+def render_json(content) -> bytes:
+    return JSONResponse(content=jsonable_encoder(content)).body
+
+async def get_product_catalog():
+    if catalog_cache["frame"] is None:
+        version = catalog_cache["version"]
+        products = await db.products.find({}, {"_id": 0, "id": 1, "brand": 1, "grade": 1, "basePrice": 1}).to_list(None)
+        frame = catalog_frame(products)
+        # An eviction that raced the load means the frame may already be stale
+        if catalog_cache["version"] != version:
+            return frame
+        catalog_cache["frame"] = frame
+    return catalog_cache["frame"]
+
 def calculate_order_totals(items: List[CartItem], user: User, payment_method: str):
     subtotal = sum(item.quantity * item.price for item in items)
     gst_amount = subtotal * GST_RATE if user.isGstRegistered else 0
@@ -192,7 +462,7 @@ def calculate_order_totals(items: List[CartItem], user: User, payment_method: st
 # Auth endpoints
 @api_router.post("/auth/register")
 async def register(user_data: UserCreate):
-    existing_user = await db.users.find_one({"email": user_data.email}, {"_id": 0})
+    existing_user = await db.users.find_one({"email": user_data.email}, {"_id": 1})
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
@@ -214,6 +484,7 @@ async def register(user_data: UserCreate):
     )
     user_dict = user.model_dump()
     user_dict["password"] = hashed_password
+    user_dict.update(user_search_fields(user_dict))
     
     await db.users.insert_one(user_dict)
     
@@ -235,42 +506,59 @@ async def login(login_data: UserLogin):
 
 @api_router.get("/auth/me")
 async def get_me(current_user: User = Depends(get_current_user)):
+    user = await db.users.find_one({"id": current_user.id}, {"_id": 0, "addresses": 1})
+    current_user.addresses = user.get("addresses", [])
     return current_user
 
 # Address endpoints
 @api_router.post("/addresses")
 async def add_address(address: Address, current_user: User = Depends(get_current_user)):
-    user = await db.users.find_one({"id": current_user.id}, {"_id": 0})
-    addresses = user.get("addresses", [])
-    
-    # If this is the first address or marked as default, set it as default
-    if len(addresses) == 0 or address.isDefault:
-        for addr in addresses:
-            addr["isDefault"] = False
-        address.isDefault = True
-    
-    addresses.append(address.model_dump())
-    await db.users.update_one({"id": current_user.id}, {"$set": {"addresses": addresses}})
+    new_address = address.model_dump()
+    del new_address["isDefault"]
+    # One pipeline update, so the default flag can never be lost or doubled between
+    # steps: the first address is always the default, and a new default clears the others
+    user = await db.users.find_one_and_update(
+        {"id": current_user.id},
+        [{"$set": {"addresses": {"$let": {
+            "vars": {"existing": {"$ifNull": ["$addresses", []]}},
+            "in": {"$let": {
+                "vars": {"isDefault": {"$or": [address.isDefault, {"$eq": [{"$size": "$$existing"}, 0]}]}},
+                "in": {"$concatArrays": [
+                    {"$cond": [
+                        "$$isDefault",
+                        {"$map": {"input": "$$existing", "as": "other", "in": {"$mergeObjects": ["$$other", {"isDefault": False}]}}},
+                        "$$existing"
+                    ]},
+                    [{"$mergeObjects": [{"$literal": new_address}, {"isDefault": "$$isDefault"}]}]
+                ]}
+            }}
+        }}}}],
+        projection={"_id": 0, "addresses": {"$elemMatch": {"id": address.id}}},
+        return_document=ReturnDocument.AFTER
+    )
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    address.isDefault = user["addresses"][0]["isDefault"]
     
     return {"message": "Address added successfully", "address": address}
 
 @api_router.get("/addresses")
 async def get_addresses(current_user: User = Depends(get_current_user)):
-    user = await db.users.find_one({"id": current_user.id}, {"_id": 0})
+    user = await db.users.find_one({"id": current_user.id}, {"_id": 0, "addresses": 1})
     return user.get("addresses", [])
 
 @api_router.delete("/addresses/{address_id}")
 async def delete_address(address_id: str, current_user: User = Depends(get_current_user)):
-    user = await db.users.find_one({"id": current_user.id}, {"_id": 0})
-    addresses = [addr for addr in user.get("addresses", []) if addr["id"] != address_id]
-    await db.users.update_one({"id": current_user.id}, {"$set": {"addresses": addresses}})
+    await db.users.update_one({"id": current_user.id}, {"$pull": {"addresses": {"id": address_id}}})
     return {"message": "Address deleted successfully"}
 
 # Product endpoints
 @api_router.get("/products", response_model=List[Product])
-async def get_products():
-    products = await db.products.find({}, {"_id": 0}).to_list(1000)
-    return products
+async def get_products(request: Request):
+    async def render():
+        products = await db.products.find({}, {"_id": 0}).to_list(1000)
+        return render_json([Product(**product) for product in products])
+    return await response_cache.response(request, "products", render)
 
 @api_router.post("/products", response_model=Product)
 async def create_product(product_data: ProductCreate, current_user: User = Depends(get_current_user)):
@@ -279,6 +567,7 @@ async def create_product(product_data: ProductCreate, current_user: User = Depen
     
     product = Product(**product_data.model_dump())
     await db.products.insert_one(product.model_dump())
+    await invalidation_bus.publish("products", [product.id])
     return product
 
 @api_router.put("/products/{product_id}", response_model=Product)
@@ -295,6 +584,7 @@ async def update_product(product_id: str, product_data: ProductCreate, current_u
     updated_product["createdAt"] = product["createdAt"]
     
     await db.products.update_one({"id": product_id}, {"$set": updated_product})
+    await invalidation_bus.publish("products", [product_id])
     return Product(**updated_product)
 
 @api_router.delete("/products/{product_id}")
@@ -305,6 +595,7 @@ async def delete_product(product_id: str, current_user: User = Depends(get_curre
     result = await db.products.delete_one({"id": product_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Product not found")
+    await invalidation_bus.publish("products", [product_id])
     return {"message": "Product deleted successfully"}
 
 # Cart endpoints
@@ -326,7 +617,7 @@ async def add_to_cart(item: CartItem, current_user: User = Depends(get_current_u
     
     if not cart:
         cart = Cart(userId=current_user.id, items=[item.model_dump()])
-        await db.carts.insert_one(cart.model_dump())
+        await db.carts.insert_one({**cart.model_dump(), "expiresAt": cart_expiry(CART_TTL_DAYS)})
     else:
         items = cart.get("items", [])
         item_exists = False
@@ -341,7 +632,7 @@ async def add_to_cart(item: CartItem, current_user: User = Depends(get_current_u
         
         await db.carts.update_one(
             {"userId": current_user.id},
-            {"$set": {"items": items, "updatedAt": datetime.now(timezone.utc).isoformat()}}
+            {"$set": {"items": items, **cart_timestamps()}}
         )
         cart["items"] = items
     
@@ -356,7 +647,7 @@ async def remove_from_cart(product_id: str, current_user: User = Depends(get_cur
     items = [item for item in cart.get("items", []) if item["productId"] != product_id]
     await db.carts.update_one(
         {"userId": current_user.id},
-        {"$set": {"items": items, "updatedAt": datetime.now(timezone.utc).isoformat()}}
+        {"$set": {"items": items, **cart_timestamps()}}
     )
     
     return {"message": "Item removed from cart"}
@@ -365,13 +656,19 @@ async def remove_from_cart(product_id: str, current_user: User = Depends(get_cur
 async def clear_cart(current_user: User = Depends(get_current_user)):
     await db.carts.update_one(
         {"userId": current_user.id},
-        {"$set": {"items": [], "updatedAt": datetime.now(timezone.utc).isoformat()}}
+        {"$set": {"items": [], **cart_timestamps()}}
     )
     return {"message": "Cart cleared"}
 
 # Order endpoints  
 @api_router.post("/orders", response_model=Order)
-async def create_order(order_data: OrderCreate, current_user: User = Depends(get_current_user)):
+async def create_order(order_data: OrderCreate, current_user: User = Depends(get_current_user), idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
+    return await run_idempotent(
+        idempotency_key, f"orders:{current_user.id}", order_data,
+        lambda: place_order(order_data, current_user)
+    )
+
+async def place_order(order_data: OrderCreate, current_user: User):
     # Validate quantities
     for item in order_data.items:
         is_valid, error_msg = validate_quantity(item.quantity)
@@ -405,9 +702,11 @@ async def create_order(order_data: OrderCreate, current_user: User = Depends(get
     )
     
     await db.orders.insert_one(order.model_dump())
+    order_index.upsert(order.model_dump(), current_user.role)
+    share_order_changes([order.id])
     await db.carts.update_one(
         {"userId": current_user.id},
-        {"$set": {"items": [], "updatedAt": datetime.now(timezone.utc).isoformat()}}
+        {"$set": {"items": [], **cart_timestamps()}}
     )
     
     # Send notification
@@ -418,40 +717,194 @@ async def create_order(order_data: OrderCreate, current_user: User = Depends(get
     
     return order
 
+@api_router.post("/orders/import")
+async def import_orders(
+    file: UploadFile = File(...),
+    paymentMethod: str = Form("cod"),
+    addressId: Optional[str] = Form(None),
+    dryRun: bool = Form(False),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Place orders from a CSV/XLSX sheet with productId (or brand and grade),
+    quantity and an optional order reference column. Nothing is created unless
+    every row is valid.
+    """
+    user = await db.users.find_one({"id": current_user.id}, {"_id": 0, "addresses": 1})
+    addresses = user.get("addresses", []) if user else []
+    if addressId:
+        address = next((a for a in addresses if a.get("id") == addressId), None)
+    else:
+        address = next((a for a in addresses if a.get("isDefault")), addresses[0] if addresses else None)
+    if not address:
+        raise HTTPException(status_code=400, detail="Add a delivery address before importing orders")
+    
+    catalog = await get_product_catalog()
+    try:
+        result = await read_order_lines(
+            file.file, file.filename or "", catalog, PRICING_MULTIPLIER.get(current_user.role, 1.0)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Could not read the sheet: {str(e)}")
+    
+    if result["errorCount"]:
+        raise HTTPException(status_code=400, detail={
+            "message": "Fix the rows below and upload the sheet again",
+            "rows": result["rows"],
+            "errorCount": result["errorCount"],
+            "errors": result["errors"],
+        })
+    if not result["orders"]:
+        raise HTTPException(status_code=400, detail="The sheet has no order lines")
+    
+    orders = []
+    for order_ref, lines in result["orders"].items():
+        items = [CartItem(**line) for line in lines]
+        subtotal, gst_amount, card_surcharge, total = calculate_order_totals(items, current_user, paymentMethod)
+        orders.append(Order(
+            userId=current_user.id,
+            items=items,
+            subtotal=subtotal,
+            gstAmount=gst_amount,
+            cardSurcharge=card_surcharge,
+            totalAmount=total,
+            paymentMethod=paymentMethod,
+            paymentStatus="cod" if paymentMethod == "cod" else "pending",
+            deliveryAddress=address,
+            orderType="bulk_import"
+        ))
+    
+    summary = {
+        "rows": result["rows"],
+        "orders": [
+            {"orderRef": order_ref, "orderId": order.id, "items": len(order.items), "totalAmount": order.totalAmount}
+            for order_ref, order in zip(result["orders"], orders)
+        ],
+    }
+    if dryRun:
+        return {**summary, "dryRun": True}
+    
+    await db.orders.insert_many([order.model_dump() for order in orders], ordered=False)
+    for order in orders:
+        order_index.upsert(order.model_dump(), current_user.role)
+    share_order_changes([order.id for order in orders])
+    return summary
+
 @api_router.get("/orders", response_model=List[Order])
 async def get_orders(current_user: User = Depends(get_current_user)):
     if current_user.role == "admin":
-        orders = await db.orders.find({}, {"_id": 0}).to_list(1000)
+        orders = await find_orders(db, {}, 1000)
     else:
-        orders = await db.orders.find({"userId": current_user.id}, {"_id": 0}).to_list(1000)
+        orders = await find_orders(db, {"userId": current_user.id}, 1000)
     return orders
 
+@api_router.get("/admin/orders/index")
+async def filter_orders(
+    order_status: Optional[str] = Query(None, alias="status"),
+    paymentStatus: Optional[str] = None,
+    deliveryStatus: Optional[str] = None,
+    role: Optional[str] = None,
+    dateFrom: Optional[str] = None,
+    dateTo: Optional[str] = None,
+    sort: str = "-createdAt",
+    skip: int = 0,
+    limit: int = 50,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Filter, count and page live orders from the in-memory index; filters take
+    comma-separated values and dates are ISO dates (dateTo is exclusive)
+    """
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    filters = {
+        column: value.split(",")
+        for column, value in {"status": order_status, "paymentStatus": paymentStatus, "deliveryStatus": deliveryStatus, "role": role}.items()
+        if value
+    }
+    try:
+        created_from = created_ms(dateFrom) if dateFrom else None
+        created_to = created_ms(dateTo) if dateTo else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be ISO formatted")
+    
+    result = order_index.query(filters, created_from, created_to, sort, max(skip, 0), min(max(limit, 1), 200))
+    found = await db.orders.find({"id": {"$in": result["ids"]}}, {"_id": 0, "invoicePath": 0}).to_list(None)
+    by_id = {order["id"]: order for order in found}
+    return {
+        "total": result["total"],
+        "facets": result["facets"],
+        "orders": [by_id[order_id] for order_id in result["ids"] if order_id in by_id],
+    }
+
+@api_router.get("/admin/orders/index/stats")
+async def order_index_stats(current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    return order_index.memory()
+
+@api_router.get("/admin/orders/search")
+async def search_orders_endpoint(q: str, limit: int = 20, current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    return await search_orders(db, q, min(max(limit, 1), 100))
+
+@api_router.post("/orders/events/token")
+async def create_order_events_token(current_user: User = Depends(get_current_user)):
+    """
+    Short-lived token for opening the order event stream as ?token=
+    """
+    token = create_access_token(
+        data={"sub": current_user.id, "scope": STREAM_TOKEN_SCOPE},
+        expires_delta=timedelta(seconds=STREAM_TOKEN_EXPIRE_SECONDS)
+    )
+    return {"token": token, "expiresIn": STREAM_TOKEN_EXPIRE_SECONDS}
+
+@api_router.get("/orders/events")
+async def order_events_stream(request: Request, current_user: User = Depends(get_stream_user)):
+    user_id = None if current_user.role == "admin" else current_user.id
+    return StreamingResponse(
+        stream_order_events(order_events, request, user_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @api_router.put("/orders/{order_id}/payment-status")
-async def update_payment_status(order_id: str, payment_status: str, transaction_id: Optional[str] = None, current_user: User = Depends(get_current_user)):
+async def update_payment_status(order_id: str, payment_status: str, transaction_id: Optional[str] = None, current_user: User = Depends(get_current_user), idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Not authorized")
     
+    return await run_idempotent(
+        idempotency_key, f"payment-status:{order_id}",
+        {"paymentStatus": payment_status, "transactionId": transaction_id},
+        lambda: apply_payment_status(order_id, payment_status, transaction_id)
+    )
+
+async def apply_payment_status(order_id: str, payment_status: str, transaction_id: Optional[str]):
     update_data = {"paymentStatus": payment_status}
     if transaction_id:
         update_data["transactionId"] = transaction_id
     
-    result = await db.orders.update_one({"id": order_id}, {"$set": update_data})
-    if result.modified_count == 0:
+    order = await db.orders.find_one_and_update(
+        {"id": order_id}, {"$set": update_data},
+        projection={"_id": 0}, return_document=ReturnDocument.AFTER
+    )
+    if order is None:
         raise HTTPException(status_code=404, detail="Order not found")
+    publish_order_event(order_id, order["userId"], update_data)
     
     # If payment received, generate invoice
     if payment_status == "received":
-        order = await db.orders.find_one({"id": order_id}, {"_id": 0})
-        user = await db.users.find_one({"id": order["userId"]}, {"_id": 0})
+        user = await db.users.find_one({"id": order["userId"]}, USER_INVOICE_PROJECTION)
         
-        # Generate invoice
-        invoice_dir = Path("/app/invoices")
-        invoice_dir.mkdir(exist_ok=True)
-        invoice_path = str(invoice_dir / f"invoice_{order_id[:8]}.pdf")
-        
-        generate_invoice_pdf(order, user, order["items"], invoice_path)
+        # Generate invoice; shares the render with a download of the same order in flight
+        invoice_path = await invoice_renders.do(order_id, lambda: issue_order_invoice(order, user))
         
         await db.orders.update_one({"id": order_id}, {"$set": {"invoicePath": invoice_path}})
+        publish_order_event(order_id, order["userId"], {"invoicePath": invoice_path})
         
         # Send notification
         message = create_order_notification_message(order, user, 'payment_received')
@@ -464,27 +917,101 @@ async def assign_driver(order_id: str, driver_name: str, driver_mobile: str, veh
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    result = await db.orders.update_one(
-        {"id": order_id},
-        {"$set": {
-            "driverName": driver_name,
-            "driverMobile": driver_mobile,
-            "vehicleNumber": vehicle_number,
-            "deliveryStatus": "driver_assigned"
-        }}
-    )
+    update_data = {
+        "driverName": driver_name,
+        "driverMobile": driver_mobile,
+        "vehicleNumber": vehicle_number,
+        "deliveryStatus": "driver_assigned"
+    }
+    result = await db.orders.update_one({"id": order_id}, {"$set": update_data})
     
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Order not found")
     
     # Send notification
     order = await db.orders.find_one({"id": order_id}, {"_id": 0})
-    user = await db.users.find_one({"id": order["userId"]}, {"_id": 0})
+    publish_order_event(order_id, order["userId"], update_data)
+    user = await db.users.find_one({"id": order["userId"]}, USER_CONTACT_PROJECTION)
     message = create_order_notification_message(order, user, 'driver_assigned')
     whatsapp_link = generate_whatsapp_link(user["phone"], message)
     
     return {"message": "Driver assigned", "whatsapp_link": whatsapp_link}
 
+@api_router.post("/admin/dispatch")
+async def plan_dispatch_run(plan_request: DispatchPlanRequest, current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    # Orders that are ready to ship and have no driver yet
+    query = {"deliveryStatus": None, "paymentStatus": {"$in": ["received", "cod"]}}
+    if plan_request.orderIds is not None:
+        query["id"] = {"$in": plan_request.orderIds}
+    orders = await db.orders.find(query, {"_id": 0, "invoicePath": 0}).to_list(10000)
+    
+    trips, unassigned = plan_dispatch(orders, [vehicle.model_dump() for vehicle in plan_request.vehicles])
+    
+    applied = 0
+    if plan_request.apply and trips:
+        operations = [
+            UpdateOne(
+                {"id": order["id"], "deliveryStatus": None},
+                {"$set": {
+                    "driverName": trip["vehicle"]["driverName"],
+                    "driverMobile": trip["vehicle"]["driverMobile"],
+                    "vehicleNumber": trip["vehicle"]["vehicleNumber"],
+                    "deliveryStatus": "driver_assigned"
+                }}
+            )
+            for trip in trips for order in trip["orders"]
+        ]
+        result = await db.orders.bulk_write(operations, ordered=False)
+        applied = result.modified_count
+        
+        # Orders another admin assigned in the meantime kept their driver; announce only ours
+        planned_ids = [order["id"] for trip in trips for order in trip["orders"]]
+        assigned = await db.orders.find({"id": {"$in": planned_ids}, "deliveryStatus": "driver_assigned"}, {"_id": 0, "id": 1, "vehicleNumber": 1}).to_list(None)
+        assigned_vehicle = {order["id"]: order.get("vehicleNumber") for order in assigned}
+        for trip in trips:
+            ours = [order for order in trip["orders"] if assigned_vehicle.get(order["id"]) == trip["vehicle"]["vehicleNumber"]]
+            for order in trip["orders"]:
+                if assigned_vehicle.get(order["id"]) != trip["vehicle"]["vehicleNumber"]:
+                    unassigned.append({"orderId": order["id"], "bags": order_bags(order), "reason": "Assigned to another vehicle meanwhile"})
+            trip["orders"] = ours
+            trip["load"] = sum(order_bags(order) for order in ours)
+        trips = [trip for trip in trips if trip["orders"]]
+    
+    user_ids = list({order["userId"] for trip in trips for order in trip["orders"]})
+    users = await db.users.find({"id": {"$in": user_ids}}, USER_CONTACT_PROJECTION).to_list(None)
+    users_by_id = {user["id"]: user for user in users}
+    
+    # Build every driver manifest and customer notification in one pass
+    response_trips = []
+    for trip in trips:
+        vehicle = trip["vehicle"]
+        notifications = []
+        for order in trip["orders"]:
+            assigned_order = {**order, "driverName": vehicle["driverName"], "driverMobile": vehicle["driverMobile"], "vehicleNumber": vehicle["vehicleNumber"], "deliveryStatus": "driver_assigned"}
+            if plan_request.apply:
+                publish_order_event(order["id"], order["userId"], assigned_order)
+            user = users_by_id.get(order["userId"])
+            if not user:
+                continue
+            message = create_order_notification_message(assigned_order, user, 'driver_assigned')
+            notifications.append({"orderId": order["id"], "whatsapp_link": generate_whatsapp_link(user["phone"], message)})
+        
+        manifest = create_dispatch_manifest_message(vehicle, trip["orders"], users_by_id)
+        response_trips.append({
+            "vehicle": vehicle,
+            "city": trip["city"],
+            "pincodes": trip["pincodes"],
+            "load": trip["load"],
+            "orders": [{"orderId": order["id"], "bags": order_bags(order)} for order in trip["orders"]],
+            "driver_whatsapp_link": generate_whatsapp_link(vehicle["driverMobile"], manifest),
+            "customer_notifications": notifications
+        })
+    
+    return {"trips": response_trips, "unassigned": unassigned, "applied": applied}
+
 @api_router.put("/orders/{order_id}/delivery-status")
 async def update_delivery_status(order_id: str, delivery_status: str, current_user: User = Depends(get_current_user)):
     if current_user.role != "admin":
@@ -496,22 +1023,112 @@ async def update_delivery_status(order_id: str, delivery_status: str, current_us
     
     # Send notification
     order = await db.orders.find_one({"id": order_id}, {"_id": 0})
-    user = await db.users.find_one({"id": order["userId"]}, {"_id": 0})
-    
-    event_map = {
-        "out_for_delivery": "out_for_delivery",
-        "delivered": "delivered"
-    }
+    publish_order_event(order_id, order["userId"], {"deliveryStatus": delivery_status})
+    user = await db.users.find_one({"id": order["userId"]}, USER_CONTACT_PROJECTION)
     
-    if delivery_status in event_map:
-        message = create_order_notification_message(order, user, event_map[delivery_status])
+    if delivery_status in DELIVERY_EVENTS:
+        message = create_order_notification_message(order, user, DELIVERY_EVENTS[delivery_status])
         whatsapp_link = generate_whatsapp_link(user["phone"], message)
     
     return {"message": "Delivery status updated"}
 
+@api_router.put("/admin/orders/payment-status")
+async def bulk_update_payment_status(updates: List[PaymentStatusUpdate], current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    if not updates:
+        return []
+    
+    order_ids = list({update.orderId for update in updates})
+    # Only orders that become "received" in this batch get an invoice and a notification
+    before = await db.orders.find({"id": {"$in": order_ids}}, {"_id": 0, "id": 1, "paymentStatus": 1}).to_list(None)
+    was_received = {order["id"] for order in before if order.get("paymentStatus") == "received"}
+    
+    operations = []
+    update_data = []
+    for update in updates:
+        data = {"paymentStatus": update.paymentStatus}
+        if update.transactionId:
+            data["transactionId"] = update.transactionId
+        update_data.append(data)
+        operations.append(UpdateOne({"id": update.orderId}, {"$set": data}))
+    await db.orders.bulk_write(operations)
+    
+    orders = await db.orders.find({"id": {"$in": order_ids}}, {"_id": 0}).to_list(None)
+    orders_by_id = {order["id"]: order for order in orders}
+    
+    final_status = {update.orderId: update.paymentStatus for update in updates}
+    received = [
+        order for order in orders
+        if final_status[order["id"]] == "received" and order.get("paymentStatus") == "received" and order["id"] not in was_received
+    ]
+    users = await db.users.find({"id": {"$in": list({order["userId"] for order in received})}}, USER_INVOICE_PROJECTION).to_list(None)
+    users_by_id = {user["id"]: user for user in users}
+    
+    invoice_updates = []
+    whatsapp_links = {}
+    for order in received:
+        user = users_by_id.get(order["userId"])
+        if not user:
+            continue
+        order["invoicePath"] = await invoice_renders.do(order["id"], lambda: issue_order_invoice(order, user))
+        invoice_updates.append(UpdateOne({"id": order["id"]}, {"$set": {"invoicePath": order["invoicePath"]}}))
+        message = create_order_notification_message(order, user, 'payment_received')
+        whatsapp_links[order["id"]] = generate_whatsapp_link(COMPANY_CONFIG['whatsapp'], message)
+    if invoice_updates:
+        await db.orders.bulk_write(invoice_updates, ordered=False)
+    
+    results = []
+    for update, data in zip(updates, update_data):
+        if update.orderId not in orders_by_id:
+            results.append({"orderId": update.orderId, "status": "not_found"})
+            continue
+        order = orders_by_id[update.orderId]
+        # Events carry only the fields this request set
+        publish_order_event(update.orderId, order["userId"], data)
+        result = {"orderId": update.orderId, "status": "updated"}
+        if update.orderId in whatsapp_links:
+            publish_order_event(update.orderId, order["userId"], {"invoicePath": order["invoicePath"]})
+            result["whatsapp_link"] = whatsapp_links.pop(update.orderId)
+        results.append(result)
+    return results
+
+@api_router.put("/admin/orders/delivery-status")
+async def bulk_update_delivery_status(updates: List[DeliveryStatusUpdate], current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    if not updates:
+        return []
+    
+    await db.orders.bulk_write([
+        UpdateOne({"id": update.orderId}, {"$set": {"deliveryStatus": update.deliveryStatus}})
+        for update in updates
+    ])
+    
+    order_ids = list({update.orderId for update in updates})
+    orders = await db.orders.find({"id": {"$in": order_ids}}, {"_id": 0, "invoicePath": 0}).to_list(None)
+    orders_by_id = {order["id"]: order for order in orders}
+    users = await db.users.find({"id": {"$in": list({order["userId"] for order in orders})}}, USER_CONTACT_PROJECTION).to_list(None)
+    users_by_id = {user["id"]: user for user in users}
+    
+    results = []
+    for update in updates:
+        order = orders_by_id.get(update.orderId)
+        if not order:
+            results.append({"orderId": update.orderId, "status": "not_found"})
+            continue
+        publish_order_event(update.orderId, order["userId"], {"deliveryStatus": update.deliveryStatus})
+        result = {"orderId": update.orderId, "status": "updated"}
+        user = users_by_id.get(order["userId"])
+        if user and update.deliveryStatus in DELIVERY_EVENTS:
+            message = create_order_notification_message({**order, "deliveryStatus": update.deliveryStatus}, user, DELIVERY_EVENTS[update.deliveryStatus])
+            result["whatsapp_link"] = generate_whatsapp_link(user["phone"], message)
+        results.append(result)
+    return results
+
 @api_router.get("/orders/{order_id}/invoice")
-async def download_invoice(order_id: str, current_user: User = Depends(get_current_user)):
-    order = await db.orders.find_one({"id": order_id}, {"_id": 0})
+async def download_invoice(order_id: str, request: Request, current_user: User = Depends(get_current_user)):
+    order = await find_order(db, order_id, {"_id": 0, "userId": 1, "invoicePath": 1, "paymentStatus": 1})
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     
@@ -519,14 +1136,24 @@ async def download_invoice(order_id: str, current_user: User = Depends(get_curre
     if current_user.role != "admin" and order["userId"] != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    if not order.get("invoicePath") or not os.path.exists(order["invoicePath"]):
-        raise HTTPException(status_code=404, detail="Invoice not generated yet")
+    invoice_path = order.get("invoicePath")
+    if not invoice_path or not os.path.exists(invoice_path):
+        if order.get("paymentStatus") != "received":
+            raise HTTPException(status_code=404, detail="Invoice not generated yet")
+        # Concurrent downloads of the same order share one render
+        invoice_path = await invoice_renders.do(order_id, lambda: render_missing_invoice(order_id))
     
-    return FileResponse(order["invoicePath"], media_type="application/pdf", filename=f"invoice_{order_id[:8]}.pdf")
+    return await conditional_file_response(request, invoice_path, "application/pdf", os.path.basename(invoice_path))
 
 # Request Order endpoints
 @api_router.post("/request-orders", response_model=RequestOrder)
-async def create_request_order(request_data: RequestOrderCreate, current_user: User = Depends(get_current_user)):
+async def create_request_order(request_data: RequestOrderCreate, current_user: User = Depends(get_current_user), idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
+    return await run_idempotent(
+        idempotency_key, f"request-orders:{current_user.id}", request_data,
+        lambda: place_request_order(request_data, current_user)
+    )
+
+async def place_request_order(request_data: RequestOrderCreate, current_user: User):
     # Validate quantity
     is_valid, error_msg = validate_quantity(request_data.quantity)
     if not is_valid:
@@ -542,6 +1169,7 @@ async def create_request_order(request_data: RequestOrderCreate, current_user: U
     )
     
     await db.request_orders.insert_one(request_order.model_dump())
+    await record_request_created(db, request_order.model_dump())
     return request_order
 
 @api_router.get("/request-orders", response_model=List[RequestOrder])
@@ -557,12 +1185,92 @@ async def update_request_order_status(request_id: str, status: str, current_user
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    result = await db.request_orders.update_one({"id": request_id}, {"$set": {"status": status}})
-    if result.modified_count == 0:
+    previous = await db.request_orders.find_one_and_update(
+        {"id": request_id},
+        {"$set": {"status": status}},
+        projection={"_id": 0, "brand": 1, "quantity": 1, "deliveryLocation": 1, "preferredDate": 1, "status": 1},
+        return_document=ReturnDocument.BEFORE
+    )
+    if previous is None:
         raise HTTPException(status_code=404, detail="Request order not found")
     
+    await record_status_change(db, previous, previous.get("status", "pending"), status)
     return {"message": "Request order status updated"}
 
+@api_router.get("/admin/demand")
+async def get_demand(brand: Optional[str] = None, location: Optional[str] = None, week: Optional[str] = None, current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    query = {}
+    if brand:
+        query["brand"] = brand
+    if location:
+        query["location"] = location.strip()
+    if week:
+        query["week"] = week
+    
+    return await db.demand_rollups.find(query, {"_id": 0}).sort([("week", 1), ("brand", 1), ("location", 1)]).to_list(1000)
+
+@api_router.post("/admin/demand/rebuild")
+async def rebuild_demand(current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    buckets = await rebuild_demand_rollups(db)
+    return {"message": "Demand rollups rebuilt", "buckets": buckets}
+
+@api_router.put("/admin/request-orders/status")
+async def bulk_update_request_order_status(updates: List[RequestStatusUpdate], current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    if not updates:
+        return []
+    
+    request_ids = list({update.requestId for update in updates})
+    previous = await db.request_orders.find(
+        {"id": {"$in": request_ids}},
+        {"_id": 0, "id": 1, "brand": 1, "quantity": 1, "deliveryLocation": 1, "preferredDate": 1, "status": 1}
+    ).to_list(None)
+    requests_by_id = {request["id"]: request for request in previous}
+    
+    # Repeated ids collapse to their last status; each transition only applies if
+    # the status is still the one read above, and is tagged so we can tell which did
+    final_status = {update.requestId: update.status for update in updates}
+    change_id = str(uuid.uuid4())
+    operations = [
+        UpdateOne(
+            {"id": request_id, "status": requests_by_id[request_id].get("status")},
+            {"$set": {"status": new_status}, "$push": {"statusChangeIds": {"$each": [change_id], "$slice": -5}}}
+        )
+        for request_id, new_status in final_status.items()
+        if request_id in requests_by_id and requests_by_id[request_id].get("status", "pending") != new_status
+    ]
+    applied = set()
+    if operations:
+        await db.request_orders.bulk_write(operations, ordered=False)
+        matched = await db.request_orders.find({"id": {"$in": request_ids}, "statusChangeIds": change_id}, {"_id": 0, "id": 1}).to_list(None)
+        applied = {request["id"] for request in matched}
+    
+    rollup_operations = []
+    for request_id in applied:
+        request = requests_by_id[request_id]
+        rollup_operations.append(status_change_operation(request, request.get("status", "pending"), final_status[request_id]))
+    
+    results = []
+    for update in updates:
+        request = requests_by_id.get(update.requestId)
+        if not request:
+            results.append({"requestId": update.requestId, "status": "not_found"})
+        elif update.requestId in applied or request.get("status", "pending") == final_status[update.requestId]:
+            results.append({"requestId": update.requestId, "status": "updated"})
+        else:
+            results.append({"requestId": update.requestId, "status": "conflict"})
+    if rollup_operations:
+        await db.demand_rollups.bulk_write(rollup_operations)
+    
+    return results
+
 # Admin endpoints
 @api_router.get("/admin/users", response_model=List[User])
 async def get_all_users(current_user: User = Depends(get_current_user)):
@@ -580,6 +1288,7 @@ async def update_user_role(user_id: str, role: str, current_user: User = Depends
     result = await db.users.update_one({"id": user_id}, {"$set": {"role": role}})
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
+    await invalidation_bus.publish("users", [user_id])
     
     return {"message": "User role updated"}
 
@@ -588,9 +1297,10 @@ async def get_analytics(current_user: User = Depends(get_current_user)):
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    # Get all orders
+    # Get all live orders; archived orders are covered by their running totals
     orders = await db.orders.find({}, {"_id": 0}).to_list(10000)
-    users = await db.users.find({}, {"_id": 0, "password": 0}).to_list(10000)
+    users = await db.users.find({}, {"_id": 0, "id": 1, "role": 1}).to_list(10000)
+    archived = await get_archive_stats(db)
     
     # Calculate analytics
     total_revenue = sum(order["totalAmount"] for order in orders if order.get("paymentStatus") == "received")
@@ -607,43 +1317,287 @@ async def get_analytics(current_user: User = Depends(get_current_user)):
             if user:
                 role = user["role"]
                 role_sales[role] = role_sales.get(role, 0) + order["totalAmount"]
+    for role, amount in archived.get("roleSales", {}).items():
+        role_sales[role] = role_sales.get(role, 0) + amount
     
     return {
-        "total_revenue": total_revenue,
+        "total_revenue": total_revenue + archived.get("revenue", 0),
         "pending_revenue": pending_revenue,
-        "total_orders": len(orders),
-        "gst_orders": len(gst_orders),
-        "non_gst_orders": len(non_gst_orders),
+        "total_orders": len(orders) + archived.get("orders", 0),
+        "gst_orders": len(gst_orders) + archived.get("gstOrders", 0),
+        "non_gst_orders": len(non_gst_orders) + archived.get("nonGstOrders", 0),
         "role_sales": role_sales,
         "total_users": len(users)
     }
 
+@api_router.get("/admin/analytics/breakdown")
+async def get_analytics_breakdown(group_by: str = "", payment_status: Optional[str] = "received", from_month: Optional[str] = None, to_month: Optional[str] = None, current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    dimensions = [dimension for dimension in group_by.split(",") if dimension]
+    unknown = [dimension for dimension in dimensions if dimension not in GROUP_DIMENSIONS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Cannot group by {', '.join(unknown)}; use {', '.join(GROUP_DIMENSIONS)}")
+    
+    statuses = payment_status.split(",") if payment_status else None
+    return revenue_breakdown(analytics_snapshot.load(), dimensions, statuses, (from_month, to_month))
+
+@api_router.post("/admin/analytics/snapshot")
+async def refresh_analytics_snapshot(current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    # Through the scheduler's per-host lease, so two refreshes never write the same version
+    rows = await maintenance.run_job("analytics-snapshot")
+    if rows is None:
+        raise HTTPException(status_code=409, detail="The analytics snapshot is being refreshed by another worker on this host, or the refresh failed; see /api/admin/maintenance")
+    return {"message": "Analytics snapshot refreshed", "rows": rows}
+
+@api_router.post("/admin/orders/archive")
+async def archive_orders(current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    # Through the scheduler, so a manual run holds the same lease as the scheduled one
+    archived = await maintenance.run_job("order-archival")
+    if archived is None:
+        raise HTTPException(status_code=409, detail="Order archival is running on another worker or failed; see /api/admin/maintenance")
+    return {"message": "Closed orders archived", "archived": archived}
+
+@api_router.get("/admin/profiles")
+async def get_profiles(current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    return await asyncio.to_thread(list_profiles, PROFILE_DIR)
+
+@api_router.get("/admin/profiles/{profile_id}")
+async def get_profile(profile_id: str, current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    profile = await asyncio.to_thread(load_profile, PROFILE_DIR, profile_id) if is_profile_id(profile_id) else None
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile
+
+@api_router.get("/admin/profiles/{profile_id}/pstats")
+async def download_profile(profile_id: str, current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    path = Path(PROFILE_DIR) / f"{profile_id}.pstats"
+    if not is_profile_id(profile_id) or not path.exists():
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(str(path), media_type="application/octet-stream", filename=f"profile_{profile_id}.pstats")
+
+@api_router.get("/admin/maintenance")
+async def get_maintenance_status(current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    return {"worker": maintenance.owner, "jobs": maintenance.metrics()}
+
+@api_router.get("/admin/loop-lag")
+async def get_loop_lag(current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    return {"worker": maintenance.owner, **loop_monitor.metrics(), "droppedLogRecords": dropped_log_records()}
+
+@api_router.get("/admin/invalidation")
+async def get_invalidation_status(current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    return {**invalidation_bus.metrics(), "responseCache": response_cache.metrics()}
+
+@api_router.post("/admin/maintenance/{job_name}")
+async def run_maintenance_job(job_name: str, current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    if job_name not in maintenance.jobs:
+        raise HTTPException(status_code=404, detail="Maintenance job not found")
+    
+    result = await maintenance.run_job(job_name)
+    return {"message": "Maintenance job finished", "result": result}
+
 @api_router.get("/config")
-async def get_config():
-    return {
-        "company": COMPANY_CONFIG,
-        "pricing": PRICING_MULTIPLIER,
-        "minOrderQty": MINIMUM_ORDER_QUANTITY,
-        "gstRate": GST_RATE,
-        "cardSurcharge": CARD_SURCHARGE_RATE
-    }
+async def get_config(request: Request):
+    async def render():
+        return render_json({
+            "company": COMPANY_CONFIG,
+            "pricing": PRICING_MULTIPLIER,
+            "minOrderQty": MINIMUM_ORDER_QUANTITY,
+            "gstRate": GST_RATE,
+            "cardSurcharge": CARD_SURCHARGE_RATE
+        })
+    return await response_cache.response(request, "config", render)
 
 app.include_router(api_router)
 
+app.add_middleware(
+    ProfilingMiddleware,
+    secret_key=SECRET_KEY,
+    algorithm=ALGORITHM,
+    output_dir=PROFILE_DIR,
+    sample_rate=PROFILE_SAMPLE_RATE
+)
+
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.environ.get('COMPRESSION_MIN_BYTES', 1024))
+)
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Profile-Id"],
 )
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+app.add_middleware(
+    RequestLogMiddleware,
+    # Access logs for hot, uninteresting routes are sampled; errors and slow requests always go out
+    sample_rates=parse_sample_rates(os.environ.get('LOG_SAMPLE_RATES', '/api/products=0.05,/api/config=0.05')),
+    slow_ms=float(os.environ.get('LOG_SLOW_REQUEST_MS', 1000))
 )
+
+# JSON logs go through a bounded queue to a writer thread; records are dropped, never waited on, when it is full
+log_listener = setup_logging(level=logging.INFO, queue_size=int(os.environ.get('LOG_QUEUE_SIZE', 10000)))
 logger = logging.getLogger(__name__)
 
+background_tasks = set()
+
+async def ensure_indexes():
+    await ensure_demand_indexes(db)
+    await idempotency_store.ensure_indexes()
+    await ensure_archive_indexes(db)
+    await ensure_search_indexes(db)
+    await ensure_maintenance_indexes(db)
+    # Range scans by the order index refresh
+    await db.orders.create_index("createdAt")
+
+async def rebuild_order_index() -> int:
+    async with order_index_rebuilds:
+        # Writes landing while the new index is read and built are replayed onto it
+        order_index.start_journal()
+        try:
+            orders = await db.orders.find({}, ORDER_INDEX_PROJECTION).to_list(None)
+            users = await db.users.find({}, {"_id": 0, "id": 1, "role": 1}).to_list(None)
+            # Building the columns is CPU work; do it off the event loop and swap the result in
+            fresh = OrderIndex()
+            await asyncio.to_thread(fresh.load, orders, {user["id"]: user["role"] for user in users})
+        except BaseException:
+            order_index.stop_journal()
+            raise
+        order_index.adopt(fresh)
+        return len(orders)
+
+async def refresh_order_index() -> int:
+    """
+    Add orders created since the newest indexed one (e.g. by other workers)
+    """
+    since = order_index.latest_created() - ORDER_INDEX_LOOKBACK_SECONDS * 1000
+    query = {"createdAt": {"$gte": datetime.fromtimestamp(max(since, 0) / 1000, timezone.utc).isoformat()}}
+    orders = await db.orders.find(query, ORDER_INDEX_PROJECTION).to_list(None)
+    users = await db.users.find({"id": {"$in": list({order["userId"] for order in orders})}}, {"_id": 0, "id": 1, "role": 1}).to_list(None)
+    roles = {user["id"]: user["role"] for user in users}
+    for order in orders:
+        order_index.upsert(order, roles.get(order["userId"]))
+    return len(orders)
+
+async def reload_order_index_roles(user_ids: list):
+    if not user_ids:
+        await rebuild_order_index()
+        return
+    for user in await db.users.find({"id": {"$in": user_ids}}, {"_id": 0, "id": 1, "role": 1}).to_list(None):
+        order_index.set_user_role(user["id"], user["role"])
+
+async def reload_order_index_rows(order_ids: list):
+    """
+    Re-read orders another worker wrote; ones no longer live (e.g. archived) are dropped
+    """
+    if not order_ids:
+        await rebuild_order_index()
+        return
+    orders = await db.orders.find({"id": {"$in": order_ids}}, ORDER_INDEX_PROJECTION).to_list(None)
+    users = await db.users.find({"id": {"$in": list({order["userId"] for order in orders})}}, {"_id": 0, "id": 1, "role": 1}).to_list(None)
+    roles = {user["id"]: user["role"] for user in users}
+    for order in orders:
+        order_index.upsert(order, roles.get(order["userId"]))
+    live = {order["id"] for order in orders}
+    order_index.remove([order_id for order_id in order_ids if order_id not in live])
+
+def refresh_order_index_rows(keys):
+    task = asyncio.get_running_loop().create_task(reload_order_index_rows(keys))
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+invalidation_bus.subscribe("orders", refresh_order_index_rows)
+
+def refresh_order_index_roles(keys):
+    task = asyncio.get_running_loop().create_task(reload_order_index_roles(keys))
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+invalidation_bus.subscribe("users", refresh_order_index_roles)
+
+async def feed_order_index():
+    # Change-stream events carry updates made by the other workers
+    queue = order_events.subscribe()
+    try:
+        while True:
+            event = await queue.get()
+            order_index.apply_changes(event["orderId"], event["changes"])
+    finally:
+        order_events.unsubscribe(queue)
+
+async def refresh_indexes_and_stats():
+    await ensure_indexes()
+    return await collection_stats(db)
+
+# Each archived batch goes out on the bus so every worker drops those orders from its index
+maintenance.add_job("order-archival", ORDER_ARCHIVE_INTERVAL_HOURS * 3600, lambda: archive_closed_orders(
+    db, ORDER_ARCHIVE_AFTER_DAYS, on_archived=lambda order_ids: invalidation_bus.publish("orders", order_ids)
+))
+# Snapshot files are local to each host, so elect one refresher per host
+maintenance.add_job("analytics-snapshot", ANALYTICS_REFRESH_MINUTES * 60, lambda: analytics_snapshot.refresh(db), lock_name=f"job:analytics-snapshot@{socket.gethostname()}")
+maintenance.add_job("cart-expiry", 6 * 3600, lambda: backfill_cart_expiry(db, CART_TTL_DAYS))
+maintenance.add_job("orphaned-invoices", 24 * 3600, lambda: remove_orphaned_invoices(db, INVOICE_DIR))
+maintenance.add_job("index-stats", 3600, refresh_indexes_and_stats)
+# Profiles are written to local disk, so prune them on every host
+maintenance.add_job("profile-cleanup", 6 * 3600, lambda: asyncio.to_thread(prune_profiles, PROFILE_DIR, PROFILE_RETENTION_DAYS * 86400), lock_name=f"job:profile-cleanup@{socket.gethostname()}")
+# Every worker holds its own copy; the rebuild also drops archived orders and compacts tombstones
+maintenance.add_job("order-index", ORDER_INDEX_REFRESH_SECONDS, refresh_order_index, leader_only=False)
+maintenance.add_job("order-index-rebuild", ORDER_INDEX_REBUILD_HOURS * 3600, rebuild_order_index, leader_only=False)
+
+@app.on_event("startup")
+async def create_indexes():
+    await ensure_indexes()
+    await backfill_search_fields(db)
+
+@app.on_event("startup")
+async def start_background_tasks():
+    if ORDER_EVENTS_SOURCE == "change_stream":
+        background_tasks.add(asyncio.create_task(watch_order_changes(db, order_events)))
+        background_tasks.add(asyncio.create_task(feed_order_index()))
+    await rebuild_order_index()
+    await invalidation_bus.ensure_collection()
+    invalidation_bus.start()
+    maintenance.start()
+    loop_monitor.register_routes(app.routes)
+    loop_monitor.start()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    for task in background_tasks:
+        task.cancel()
+    await maintenance.stop()
+    await loop_monitor.stop()
+    await invalidation_bus.stop()
+    await invoice_allocator.release()
+    client.close()
+    profiled_client.close()
+    log_listener.stop()
\ No newline at end of file
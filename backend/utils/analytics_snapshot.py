@@ -0,0 +1,208 @@
+import asyncio
+import json
+import os
+import shutil
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from config import GST_RATE
+
+NUMERIC_COLUMNS = {'quantity': np.int64, 'amount': np.float64, 'gst': np.float64}
+CATEGORY_COLUMNS = ('orderId', 'brand', 'grade', 'role', 'city', 'month', 'paymentStatus', 'gstRegistered')
+
+# Dimensions the breakdown endpoint can group by, mapped to snapshot columns
+GROUP_DIMENSIONS = {
+    'brand': 'brand',
+    'grade': 'grade',
+    'role': 'role',
+    'city': 'city',
+    'month': 'month',
+    'gst': 'gstRegistered',
+    'payment_status': 'paymentStatus',
+}
+
+ORDER_PROJECTION = {'_id': 0, 'id': 1, 'userId': 1, 'items': 1, 'gstAmount': 1, 'status': 1, 'paymentStatus': 1, 'deliveryAddress.city': 1, 'createdAt': 1}
+
+# Orders in these states will not be paid, so they are not re-read as open
+CLOSED_ORDER_STATUSES = ('cancelled', 'rejected')
+
+def flatten_orders(orders: list, roles: dict) -> pd.DataFrame:
+    """
+    One row per order line with the dimensions finance reports on
+    """
+    rows = []
+    for order in orders:
+        gst_registered = order.get('gstAmount', 0) > 0
+        city = ((order.get('deliveryAddress') or {}).get('city') or '').strip().title() or 'Unknown'
+        for item in order.get('items', []):
+            amount = item['quantity'] * item['price']
+            rows.append({
+                'orderId': order['id'],
+                'brand': item.get('brand') or 'Unknown',
+                'grade': item.get('grade') or 'Unknown',
+                'role': roles.get(order['userId'], 'unknown'),
+                'city': city,
+                'month': order['createdAt'][:7],
+                'paymentStatus': order.get('paymentStatus', 'pending'),
+                'gstRegistered': 'gst' if gst_registered else 'non_gst',
+                'quantity': item['quantity'],
+                'amount': amount,
+                'gst': amount * GST_RATE if gst_registered else 0.0,
+            })
+    frame = pd.DataFrame(rows, columns=list(CATEGORY_COLUMNS) + list(NUMERIC_COLUMNS))
+    return frame.astype(NUMERIC_COLUMNS)
+
+class AnalyticsSnapshot:
+    """
+    Columnar order-line snapshot stored as one .npy file per column. Each refresh
+    writes a new version directory and flips CURRENT, so readers memory-map a
+    consistent set of columns without locking.
+
+    createdAt is stamped before the insert, so an order can land after a refresh
+    that already moved the high-water mark past it; each refresh re-reads the
+    last `lookback` before the mark to pick such orders up.
+
+    Unpaid orders are re-read on every refresh until they are paid, closed or
+    older than open_max_age, which keeps that set (and meta.json) bounded.
+    """
+    def __init__(self, directory, lookback: timedelta = timedelta(minutes=10), open_max_age: timedelta = timedelta(days=90)):
+        self.directory = Path(directory)
+        self.lookback = lookback
+        self.open_max_age = open_max_age
+        self._loaded_version = None
+        self._frame = None
+
+    def _current_version(self):
+        try:
+            return int((self.directory / 'CURRENT').read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _read_meta(self, version: int) -> dict:
+        return json.loads((self.directory / f'v{version}' / 'meta.json').read_text())
+
+    def load(self) -> pd.DataFrame:
+        """
+        Memory-map the current snapshot; cached until a newer version is written
+        """
+        version = self._current_version()
+        if version is None:
+            return flatten_orders([], {})
+        if version != self._loaded_version:
+            path = self.directory / f'v{version}'
+            meta = self._read_meta(version)
+            columns = {name: np.load(path / f'{name}.npy', mmap_mode='r') for name in NUMERIC_COLUMNS}
+            for name in CATEGORY_COLUMNS:
+                codes = np.load(path / f'{name}.codes.npy', mmap_mode='r')
+                columns[name] = pd.Categorical.from_codes(codes, categories=meta['categories'][name])
+            self._frame = pd.DataFrame(columns, copy=False)
+            self._loaded_version = version
+        return self._frame
+
+    def _write(self, frame: pd.DataFrame, meta: dict):
+        version = (self._current_version() or 0) + 1
+        path = self.directory / f'v{version}'
+        path.mkdir(parents=True, exist_ok=True)
+
+        meta = {**meta, 'rows': len(frame), 'categories': {}}
+        for name in NUMERIC_COLUMNS:
+            np.save(path / f'{name}.npy', frame[name].to_numpy())
+        for name in CATEGORY_COLUMNS:
+            categorical = pd.Categorical(frame[name])
+            np.save(path / f'{name}.codes.npy', categorical.codes.astype(np.int32))
+            meta['categories'][name] = [str(category) for category in categorical.categories]
+        (path / 'meta.json').write_text(json.dumps(meta))
+
+        current = self.directory / 'CURRENT.tmp'
+        current.write_text(str(version))
+        os.replace(current, self.directory / 'CURRENT')
+
+        # Open memory maps keep unlinked files readable, so old versions can go now
+        for old in self.directory.glob('v*'):
+            if old.name != f'v{version}':
+                shutil.rmtree(old, ignore_errors=True)
+
+    async def refresh(self, db) -> int:
+        """
+        Replace the rows of orders created since the high-water mark (less the
+        lookback window) and of orders whose payment is still open. The first run
+        reads live and archived orders.
+        """
+        version = self._current_version()
+        meta = self._read_meta(version) if version is not None else None
+
+        if meta is None:
+            orders = await db.orders.find({}, ORDER_PROJECTION).to_list(None)
+            orders += await db.orders_archive.find({}, ORDER_PROJECTION).to_list(None)
+            existing = flatten_orders([], {})
+        else:
+            since = meta['highWaterMark']
+            if since:
+                since = (datetime.fromisoformat(since) - self.lookback).isoformat()
+            query = {'$or': [{'createdAt': {'$gte': since}}, {'id': {'$in': meta['openOrderIds']}}]}
+            orders = await db.orders.find(query, ORDER_PROJECTION).to_list(None)
+            # Open orders may have been paid, delivered and archived since the last run
+            found = {order['id'] for order in orders}
+            missing = [order_id for order_id in meta['openOrderIds'] if order_id not in found]
+            if missing:
+                orders += await db.orders_archive.find({'id': {'$in': missing}}, ORDER_PROJECTION).to_list(None)
+            existing = self.load()
+
+        users = await db.users.find({'id': {'$in': list({order['userId'] for order in orders})}}, {'_id': 0, 'id': 1, 'role': 1}).to_list(None)
+        roles = {user['id']: user['role'] for user in users}
+
+        def build():
+            fresh = flatten_orders(orders, roles)
+            kept = existing
+            if meta is not None:
+                refreshed = {order['id'] for order in orders} | set(meta['openOrderIds'])
+                kept = existing[~existing['orderId'].isin(refreshed)]
+            frame = pd.concat([kept.astype({name: str for name in CATEGORY_COLUMNS}), fresh], ignore_index=True)
+            # Every open order was in this read, so the open set is rebuilt from it alone
+            open_since = (datetime.now(timezone.utc) - self.open_max_age).isoformat()
+            open_ids = [
+                order['id'] for order in orders
+                if order.get('paymentStatus', 'pending') != 'received'
+                and order.get('status') not in CLOSED_ORDER_STATUSES
+                and order['createdAt'] >= open_since
+            ]
+            high_water = max([order['createdAt'] for order in orders] + ([meta['highWaterMark']] if meta else []), default='')
+            self._write(frame, {'highWaterMark': high_water, 'openOrderIds': open_ids})
+            return len(frame)
+
+        return await asyncio.to_thread(build)
+
+def revenue_breakdown(frame: pd.DataFrame, group_by: list, payment_statuses: list = None, months: tuple = (None, None)) -> list:
+    """
+    Vectorized group-by over the snapshot; months is an inclusive (from, to) YYYY-MM range
+    """
+    mask = np.ones(len(frame), dtype=bool)
+    if payment_statuses:
+        mask &= frame['paymentStatus'].isin(payment_statuses).to_numpy()
+    if months[0] or months[1]:
+        # Compare the few distinct months, not every row
+        month = frame['month']
+        values = month.cat.categories if isinstance(month.dtype, pd.CategoricalDtype) else month.unique()
+        allowed = [m for m in values if (not months[0] or m >= months[0]) and (not months[1] or m <= months[1])]
+        mask &= month.isin(allowed).to_numpy()
+    selected = frame[mask]
+
+    columns = [GROUP_DIMENSIONS[dimension] for dimension in group_by]
+    totals = {
+        'quantity': ('quantity', 'sum'),
+        'revenue': ('amount', 'sum'),
+        'gstAmount': ('gst', 'sum'),
+        'orders': ('orderId', 'nunique'),
+    }
+    if not columns:
+        return [{
+            'quantity': int(selected['quantity'].sum()),
+            'revenue': float(selected['amount'].sum()),
+            'gstAmount': float(selected['gst'].sum()),
+            'orders': int(selected['orderId'].nunique()),
+        }]
+
+    grouped = selected.groupby(columns, observed=True).agg(**totals).reset_index()
+    grouped = grouped.rename(columns={GROUP_DIMENSIONS[dimension]: dimension for dimension in group_by})
+    return grouped.astype({dimension: str for dimension in group_by}).to_dict(orient='records')
@@ -0,0 +1,171 @@
+import asyncio
+import zipfile
+import numpy as np
+import pandas as pd
+from config import MINIMUM_ORDER_QUANTITY, ALLOWED_QUANTITY_MULTIPLES
+from utils.gst_validator import validate_quantity
+
+try:
+    import openpyxl
+    from openpyxl.utils.exceptions import InvalidFileException
+except ImportError:  # Excel uploads are optional; CSV always works
+    openpyxl = None
+
+# Header spellings dealers use, keyed by the header lower-cased without spaces or underscores
+COLUMN_ALIASES = {
+    'productid': 'productId',
+    'product': 'productId',
+    'brand': 'brand',
+    'grade': 'grade',
+    'quantity': 'quantity',
+    'qty': 'quantity',
+    'bags': 'quantity',
+    'orderref': 'orderRef',
+    'order': 'orderRef',
+    'reference': 'orderRef',
+}
+
+class ImportFormatError(ValueError):
+    pass
+
+def normalize_columns(frame: pd.DataFrame) -> pd.DataFrame:
+    renamed = {}
+    for column in frame.columns:
+        key = str(column).strip().lower().replace(' ', '').replace('_', '')
+        if key in COLUMN_ALIASES:
+            renamed[column] = COLUMN_ALIASES[key]
+    frame = frame.rename(columns=renamed)[list(dict.fromkeys(renamed.values()))]
+    if 'quantity' not in frame.columns:
+        raise ImportFormatError("Missing a quantity column")
+    if 'productId' not in frame.columns and not {'brand', 'grade'} <= set(frame.columns):
+        raise ImportFormatError("Rows need a productId column or brand and grade columns")
+    return frame
+
+def _excel_chunks(file, chunk_size: int):
+    if openpyxl is None:
+        raise ImportFormatError("Excel import is not available on this server; upload a CSV instead")
+    try:
+        workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    except (InvalidFileException, zipfile.BadZipFile, KeyError) as e:
+        # A corrupt or renamed file is the uploader's mistake, not a server error
+        raise ImportFormatError(f"Not a valid Excel workbook ({e.__class__.__name__})")
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == chunk_size:
+                yield pd.DataFrame(batch, columns=header, dtype=object)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=header, dtype=object)
+    finally:
+        workbook.close()
+
+def read_chunks(file, filename: str, chunk_size: int = 5000):
+    """
+    Spreadsheet rows as DataFrames of at most chunk_size rows, so an upload of
+    any length is never held in memory as a whole
+    """
+    if filename.lower().endswith(('.xlsx', '.xlsm')):
+        yield from _excel_chunks(file, chunk_size)
+    else:
+        yield from pd.read_csv(file, dtype=str, chunksize=chunk_size, skip_blank_lines=False)
+
+def catalog_frame(products: list) -> pd.DataFrame:
+    catalog = pd.DataFrame(products, columns=['id', 'brand', 'grade', 'basePrice'])
+    catalog['key'] = catalog['brand'].str.strip().str.lower() + '|' + catalog['grade'].str.strip().str.lower()
+    return catalog.reset_index(drop=True)
+
+def _text(frame: pd.DataFrame, column: str) -> pd.Series:
+    if column not in frame.columns:
+        return pd.Series('', index=frame.index)
+    return frame[column].fillna('').astype(str).str.strip()
+
+def _add_error(errors: pd.Series, mask: pd.Series, message):
+    message = message[mask] if isinstance(message, pd.Series) else message
+    errors[mask] = np.where(errors[mask] == '', message, errors[mask] + '; ' + message)
+
+def validate_chunk(chunk: pd.DataFrame, catalog: pd.DataFrame, multiplier: float):
+    """
+    Validate a chunk column-wise. Returns the valid lines (priced for the
+    importing user's role) and the errors of the rejected rows, numbered as in
+    the spreadsheet (the header is row 1, chunk.index counts data rows from 0).
+    """
+    chunk = normalize_columns(chunk)
+    errors = pd.Series('', index=chunk.index, dtype=object)
+
+    quantity = pd.to_numeric(chunk['quantity'], errors='coerce')
+    whole = quantity.notna() & (quantity % 1 == 0)
+    allowed = whole & (quantity >= MINIMUM_ORDER_QUANTITY)
+    allowed &= np.logical_or.reduce([quantity % multiple == 0 for multiple in ALLOWED_QUANTITY_MULTIPLES])
+    _add_error(errors, ~whole, "Quantity must be a whole number")
+    # Messages come from the same rules the cart uses, once per distinct bad quantity
+    rejected = whole & ~allowed
+    messages = {q: validate_quantity(int(q))[1] for q in quantity[rejected].unique()}
+    _add_error(errors, rejected, quantity.map(messages))
+
+    product_ids = _text(chunk, 'productId')
+    keys = _text(chunk, 'brand').str.lower() + '|' + _text(chunk, 'grade').str.lower()
+    by_id = pd.Series(catalog.index, index=catalog['id'])
+    by_key = pd.Series(catalog.index, index=catalog['key']).groupby(level=0).first()
+    position = product_ids.map(by_id).fillna(keys.map(by_key))
+    _add_error(errors, position.isna(), "Unknown product")
+
+    valid = errors == ''
+    matched = catalog.loc[position[valid].astype(int)].set_index(chunk.index[valid])
+    lines = pd.DataFrame({
+        'orderRef': _text(chunk, 'orderRef')[valid],
+        'productId': matched['id'],
+        'brand': matched['brand'],
+        'grade': matched['grade'],
+        'quantity': quantity[valid].astype(int),
+        'price': matched['basePrice'] * multiplier,
+    })
+    row_errors = [
+        {'row': int(index) + 2, 'errors': message.split('; ')}
+        for index, message in errors[~valid].items()
+    ]
+    return lines, row_errors
+
+async def read_order_lines(file, filename: str, catalog: pd.DataFrame, multiplier: float, chunk_size: int = 5000, max_errors: int = 500) -> dict:
+    """
+    Stream an uploaded spreadsheet and validate it chunk by chunk. Lines for the
+    same order reference and product are summed, so what is kept grows with the
+    number of distinct orders and products, not with the number of rows.
+    """
+    chunks = read_chunks(file, filename, chunk_size)
+    lines = {}
+    errors = []
+    error_count = 0
+    rows = 0
+    while True:
+        # Parsing is CPU and file bound; keep it off the event loop
+        chunk = await asyncio.to_thread(next, chunks, None)
+        if chunk is None:
+            break
+        chunk.index = pd.RangeIndex(rows, rows + len(chunk))
+        rows += len(chunk)
+        chunk = chunk.dropna(how='all')
+        if chunk.empty:
+            continue
+        valid, row_errors = validate_chunk(chunk, catalog, multiplier)
+        error_count += len(row_errors)
+        errors.extend(row_errors[:max(max_errors - len(errors), 0)])
+
+        grouped = valid.groupby(['orderRef', 'productId'], sort=False).agg(
+            quantity=('quantity', 'sum'), price=('price', 'first'), brand=('brand', 'first'), grade=('grade', 'first')
+        )
+        for (order_ref, product_id), line in zip(grouped.index, grouped.to_dict('records')):
+            if (order_ref, product_id) in lines:
+                lines[(order_ref, product_id)]['quantity'] += int(line['quantity'])
+            else:
+                lines[(order_ref, product_id)] = {'productId': product_id, **line, 'quantity': int(line['quantity'])}
+
+    orders = {}
+    for (order_ref, _), line in lines.items():
+        orders.setdefault(order_ref, []).append(line)
+    return {'rows': rows, 'orders': orders, 'errors': errors, 'errorCount': error_count}
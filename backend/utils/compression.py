@@ -0,0 +1,177 @@
+import gzip
+import hashlib
+import zlib
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:  # gzip only when brotli is not installed
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/', 'application/javascript', 'image/svg+xml')
+
+def accepted_encodings(accept_encoding: str) -> dict:
+    """
+    Accept-Encoding parsed into {coding: q}, dropping codings refused with q=0
+    """
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        q = 1.0
+        if params.strip().startswith('q='):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if coding and q > 0:
+            accepted[coding.strip().lower()] = q
+    return accepted
+
+def negotiate(accept_encoding: str):
+    """
+    Best coding we can produce for the client: br, then gzip, else None
+    """
+    accepted = accepted_encodings(accept_encoding)
+    candidates = (['br'] if brotli is not None else []) + ['gzip']
+    ranked = [(accepted.get(coding, accepted.get('*', 0)), -index, coding) for index, coding in enumerate(candidates)]
+    q, _, coding = max(ranked)
+    return coding if q > 0 else None
+
+class _Compressor:
+    def __init__(self, coding: str, level: int):
+        if coding == 'br':
+            self._impl = brotli.Compressor(quality=min(level, 11))
+            self.compress, self.flush = self._impl.process, self._impl.finish
+        else:
+            self._impl = zlib.compressobj(level, zlib.DEFLATED, 31)
+            self.compress, self.flush = self._impl.compress, self._impl.flush
+
+class CompressionMiddleware:
+    """
+    Compresses API responses with the best coding the client accepts. The body
+    is compressed chunk by chunk as it streams, so large listings are never
+    buffered whole. Small bodies, already-encoded responses, partial content,
+    event streams and binary types go out untouched.
+    """
+    def __init__(self, app, minimum_size: int = 1024, level: int = 6):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.level = level
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        coding = negotiate(Headers(scope=scope).get('accept-encoding'))
+        if coding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        compressor = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, compressor, passthrough
+            if message['type'] == 'http.response.start':
+                headers = Headers(raw=message['headers'])
+                content_type = headers.get('content-type', '')
+                passthrough = (
+                    message['status'] in (204, 206, 304)
+                    or 'content-encoding' in headers
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                    # Compressor buffering would hold back server-sent events
+                    or content_type.startswith('text/event-stream')
+                )
+                if passthrough:
+                    await send(message)
+                else:
+                    start = message
+                return
+            if passthrough or message['type'] != 'http.response.body':
+                await send(message)
+                return
+
+            body = message.get('body', b'')
+            more_body = message.get('more_body', False)
+            if compressor is None:
+                if not more_body and len(body) < self.minimum_size:
+                    await send(start)
+                    await send(message)
+                    passthrough = True
+                    return
+                compressor = _Compressor(coding, self.level)
+                headers = MutableHeaders(raw=start['headers'])
+                headers['content-encoding'] = coding
+                headers.add_vary_header('Accept-Encoding')
+                del headers['content-length']
+                await send(start)
+
+            chunk = compressor.compress(body)
+            if not more_body:
+                chunk += compressor.flush()
+            if chunk or not more_body:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': more_body})
+
+        await self.app(scope, receive, send_compressed)
+
+class PrecompressedCache:
+    """
+    Rendered bodies for cacheable GET endpoints, kept with their gzip (and
+    brotli) variants so compression runs once per content version. Entries are
+    dropped through evict() when the underlying data changes.
+    """
+    def __init__(self, level: int = 9):
+        self.level = level
+        self.entries = {}
+        self.versions = {}
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def evict(self, key: str = None):
+        keys = [key] if key else list(self.entries)
+        for name in keys:
+            self.versions[name] = self.versions.get(name, 0) + 1
+            if self.entries.pop(name, None) is not None:
+                self.stats['evictions'] += 1
+
+    def _variants(self, body: bytes) -> dict:
+        variants = {'identity': body, 'gzip': gzip.compress(body, compresslevel=self.level, mtime=0)}
+        if brotli is not None:
+            variants['br'] = brotli.compress(body, quality=11)
+        return variants
+
+    async def response(self, request, key: str, render, media_type: str = 'application/json') -> Response:
+        """
+        Serve key from the cache, calling render() for the body bytes on a miss
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            self.stats['misses'] += 1
+            version = self.versions.get(key, 0)
+            body = await render()
+            entry = {'etag': f'"{hashlib.md5(body).hexdigest()}"', 'variants': self._variants(body)}
+            # Data changed while rendering; serve this body but do not keep it
+            if self.versions.get(key, 0) == version:
+                self.entries[key] = entry
+        else:
+            self.stats['hits'] += 1
+
+        headers = {'etag': entry['etag'], 'vary': 'Accept-Encoding', 'cache-control': 'no-cache'}
+        if entry['etag'] in [tag.strip() for tag in request.headers.get('if-none-match', '').split(',')]:
+            return Response(status_code=304, headers=headers)
+        coding = negotiate(request.headers.get('accept-encoding'))
+        if coding in entry['variants']:
+            headers['content-encoding'] = coding
+        else:
+            coding = 'identity'
+        return Response(entry['variants'][coding], media_type=media_type, headers=headers)
+
+    def metrics(self) -> dict:
+        return {
+            **self.stats,
+            'entries': {
+                key: {coding: len(body) for coding, body in entry['variants'].items()}
+                for key, entry in self.entries.items()
+            },
+        }
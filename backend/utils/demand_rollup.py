@@ -0,0 +1,144 @@
+from datetime import datetime
+from pymongo import ASCENDING, UpdateOne
+
+# Request order statuses that still represent unmet demand
+OPEN_REQUEST_STATUSES = ('pending', 'approved')
+UNSCHEDULED_WEEK = 'unscheduled'
+
+def demand_week(preferred_date: str) -> str:
+    """
+    ISO week key (e.g. 2026-W07) for a request order's preferred date
+    """
+    try:
+        iso_year, iso_week, _ = datetime.fromisoformat((preferred_date or '')[:10]).isocalendar()
+    except ValueError:
+        return UNSCHEDULED_WEEK
+    return f"{iso_year}-W{iso_week:02d}"
+
+def demand_key(request_order: dict) -> dict:
+    """
+    Rollup bucket (brand, location, week) a request order belongs to
+    """
+    return {
+        'brand': request_order['brand'],
+        'location': request_order['deliveryLocation'].strip(),
+        'week': demand_week(request_order.get('preferredDate')),
+    }
+
+def status_delta(request_order: dict, status: str, sign: int) -> dict:
+    """
+    $inc document adding (sign=1) or removing (sign=-1) a request order under a status
+    """
+    quantity = request_order['quantity'] * sign
+    inc = {f'statusQuantity.{status}': quantity}
+    if status in OPEN_REQUEST_STATUSES:
+        inc['openQuantity'] = quantity
+        inc['openRequests'] = sign
+    return inc
+
+async def ensure_demand_indexes(db):
+    await db.demand_rollups.create_index(
+        [('brand', ASCENDING), ('location', ASCENDING), ('week', ASCENDING)], unique=True
+    )
+    await db.demand_rollups.create_index([('week', ASCENDING), ('location', ASCENDING)])
+
+async def record_request_created(db, request_order: dict):
+    """
+    Add a newly created request order to its rollup bucket
+    """
+    await db.demand_rollups.update_one(
+        demand_key(request_order),
+        {'$inc': status_delta(request_order, request_order.get('status', 'pending'), 1)},
+        upsert=True
+    )
+
+def status_change_operation(request_order: dict, old_status: str, new_status: str):
+    """
+    Rollup update moving a request order from its old status to the new one, or None
+    """
+    if old_status == new_status:
+        return None
+    inc = status_delta(request_order, old_status, -1)
+    for field, value in status_delta(request_order, new_status, 1).items():
+        inc[field] = inc.get(field, 0) + value
+    return UpdateOne(demand_key(request_order), {'$inc': inc}, upsert=True)
+
+async def record_status_change(db, request_order: dict, old_status: str, new_status: str):
+    """
+    Move a request order's quantity from its old status to the new one
+    """
+    operation = status_change_operation(request_order, old_status, new_status)
+    if operation:
+        await db.demand_rollups.bulk_write([operation])
+
+def _week_expression():
+    preferred = {'$dateFromString': {
+        'dateString': {'$substrCP': [{'$ifNull': ['$preferredDate', '']}, 0, 10]},
+        'format': '%Y-%m-%d',
+        'onError': None,
+        'onNull': None,
+    }}
+    return {'$let': {
+        'vars': {'d': preferred},
+        'in': {'$cond': [
+            {'$eq': ['$$d', None]},
+            UNSCHEDULED_WEEK,
+            {'$concat': [
+                {'$toString': {'$isoWeekYear': '$$d'}},
+                '-W',
+                {'$cond': [{'$lt': [{'$isoWeek': '$$d'}, 10]}, '0', '']},
+                {'$toString': {'$isoWeek': '$$d'}},
+            ]},
+        ]},
+    }}
+
+async def rebuild_demand_rollups(db) -> int:
+    """
+    Recompute every rollup bucket from request_orders and replace the collection
+    """
+    is_open = {'$in': ['$status', list(OPEN_REQUEST_STATUSES)]}
+    pipeline = [
+        {'$group': {
+            '_id': {
+                'brand': '$brand',
+                'location': {'$trim': {'input': '$deliveryLocation'}},
+                'week': _week_expression(),
+                'status': '$status',
+            },
+            'quantity': {'$sum': '$quantity'},
+            'requests': {'$sum': 1},
+            'open': {'$first': is_open},
+        }},
+        {'$group': {
+            '_id': {'brand': '$_id.brand', 'location': '$_id.location', 'week': '$_id.week'},
+            'statusQuantity': {'$push': {'k': '$_id.status', 'v': '$quantity'}},
+            'openQuantity': {'$sum': {'$cond': ['$open', '$quantity', 0]}},
+            'openRequests': {'$sum': {'$cond': ['$open', '$requests', 0]}},
+        }},
+        {'$project': {
+            '_id': 0,
+            'brand': '$_id.brand',
+            'location': '$_id.location',
+            'week': '$_id.week',
+            'statusQuantity': {'$arrayToObject': '$statusQuantity'},
+            'openQuantity': 1,
+            'openRequests': 1,
+        }},
+        {'$out': 'demand_rollups'},
+    ]
+    await db.request_orders.aggregate(pipeline).to_list(None)
+    await ensure_demand_indexes(db)
+    return await db.demand_rollups.count_documents({})
+
+if __name__ == '__main__':
+    # Rebuild from the command line: python -m utils.demand_rollup
+    import asyncio
+    import os
+    from pathlib import Path
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent.parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    buckets = asyncio.run(rebuild_demand_rollups(client[os.environ['DB_NAME']]))
+    print(f"Rebuilt {buckets} demand rollup buckets")
@@ -0,0 +1,59 @@
+def order_bags(order: dict) -> int:
+    """
+    Total number of bags in an order
+    """
+    return sum(item.get('quantity', 0) for item in order.get('items', []))
+
+def _area(order: dict) -> tuple:
+    address = order.get('deliveryAddress') or {}
+    city = (address.get('city') or '').strip().lower() or 'unknown'
+    pincode = (address.get('pincode') or '').strip() or city
+    return city, pincode
+
+def plan_dispatch(orders: list, vehicles: list) -> tuple:
+    """
+    Pack orders into vehicles by bag capacity, keeping each load within one city.
+    Orders are grouped by city and pincode, largest first; each order goes to the
+    tightest vehicle already serving its pincode, then its city, then the
+    smallest empty vehicle that can carry it.
+    Returns: (trips: list, unassigned: list)
+    """
+    trips = [
+        {'vehicle': vehicle, 'city': None, 'pincodes': [], 'orders': [], 'load': 0}
+        for vehicle in sorted(vehicles, key=lambda v: v['capacity'])
+    ]
+
+    cities = {}
+    for order in orders:
+        city, pincode = _area(order)
+        cities.setdefault(city, {}).setdefault(pincode, []).append(order)
+
+    def group_bags(group):
+        return sum(order_bags(order) for order in group)
+
+    unassigned = []
+    for city, pincodes in sorted(cities.items(), key=lambda c: -sum(group_bags(g) for g in c[1].values())):
+        for pincode, group in sorted(pincodes.items(), key=lambda p: -group_bags(p[1])):
+            for order in sorted(group, key=order_bags, reverse=True):
+                bags = order_bags(order)
+
+                def fits(trip):
+                    return trip['vehicle']['capacity'] - trip['load'] >= bags
+
+                candidates = (
+                    [t for t in trips if pincode in t['pincodes'] and fits(t)]
+                    or [t for t in trips if t['city'] == city and fits(t)]
+                    or [t for t in trips if t['city'] is None and fits(t)]
+                )
+                if not candidates:
+                    unassigned.append({'orderId': order['id'], 'bags': bags, 'reason': 'No vehicle with enough capacity'})
+                    continue
+
+                trip = min(candidates, key=lambda t: t['vehicle']['capacity'] - t['load'])
+                trip['city'] = city
+                if pincode not in trip['pincodes']:
+                    trip['pincodes'].append(pincode)
+                trip['orders'].append(order)
+                trip['load'] += bags
+
+    return [trip for trip in trips if trip['orders']], unassigned
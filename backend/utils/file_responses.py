@@ -0,0 +1,72 @@
+import asyncio
+import os
+import re
+from email.utils import formatdate, parsedate_to_datetime
+from starlette.responses import FileResponse, Response
+
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+def _read_range(path: str, start: int, length: int) -> bytes:
+    with open(path, 'rb') as f:
+        f.seek(start)
+        return f.read(length)
+
+def _not_modified(request, etag: str, mtime: float) -> bool:
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in tags or etag in tags or f'W/{etag}' in tags
+    if_modified_since = request.headers.get('if-modified-since')
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+async def conditional_file_response(request, path: str, media_type: str, filename: str):
+    """
+    Serve a file with ETag/Last-Modified validators, 304 revalidation and
+    single byte-range (206) support.
+    """
+    stat = os.stat(path)
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    headers = {
+        'etag': etag,
+        'last-modified': formatdate(stat.st_mtime, usegmt=True),
+        'accept-ranges': 'bytes',
+        'cache-control': 'private, max-age=0, must-revalidate',
+    }
+
+    if _not_modified(request, etag, stat.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get('range')
+    if_range = request.headers.get('if-range')
+    if range_header and (if_range is None or if_range in (etag, headers['last-modified'])):
+        match = _RANGE.match(range_header.strip())
+        # Multi-range and malformed requests get the whole file, as RFC 9110 allows
+        if match and (match.group(1) or match.group(2)):
+            size = stat.st_size
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            else:
+                start = max(size - int(match.group(2)), 0)
+                end = size - 1
+            if start >= size or start > end:
+                return Response(status_code=416, headers={**headers, 'content-range': f'bytes */{size}'})
+
+            content = await asyncio.to_thread(_read_range, path, start, end - start + 1)
+            return Response(
+                content,
+                status_code=206,
+                media_type=media_type,
+                headers={
+                    **headers,
+                    'content-range': f'bytes {start}-{end}/{size}',
+                    'content-disposition': f'attachment; filename="{filename}"',
+                },
+            )
+
+    return FileResponse(path, media_type=media_type, filename=filename, headers=headers, stat_result=stat)
@@ -0,0 +1,106 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+class IdempotencyConflict(Exception):
+    """Another request with the same key is still being processed"""
+
+class IdempotencyKeyReused(Exception):
+    """The key was already used for a request with a different payload"""
+
+def request_fingerprint(payload) -> str:
+    """
+    Stable hash of a JSON-compatible request payload
+    """
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+class IdempotencyStore:
+    """
+    Stored responses for Idempotency-Key requests. Records live in MongoDB behind a
+    TTL index; completed records are also kept in a small in-process LRU so most
+    replays never reach the database. A claimed key is held on a short lease, so
+    a worker that dies mid-request blocks retries for lease_seconds, not the TTL.
+    """
+    def __init__(self, collection, ttl_seconds: int = 86400, cache_size: int = 1024, lease_seconds: int = 60):
+        self.collection = collection
+        self.ttl_seconds = ttl_seconds
+        self.lease_seconds = lease_seconds
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+
+    async def ensure_indexes(self):
+        await self.collection.create_index('createdAt', expireAfterSeconds=self.ttl_seconds)
+
+    def _cached(self, key: str):
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        expires_at, record = entry
+        if expires_at < time.monotonic():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return record
+
+    def _remember(self, key: str, record: dict):
+        self._cache[key] = (time.monotonic() + self.ttl_seconds, record)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def begin(self, key: str, fingerprint: str):
+        """
+        Return the stored record for a completed key, or claim the key and return None.
+        An in-progress key whose lease has run out is taken over.
+        Raises IdempotencyConflict / IdempotencyKeyReused.
+        """
+        record = self._cached(key)
+        if record is None:
+            record = await self.collection.find_one({'_id': key})
+        now = datetime.now(timezone.utc)
+        locked_until = now + timedelta(seconds=self.lease_seconds)
+        if record is None:
+            try:
+                await self.collection.insert_one({
+                    '_id': key,
+                    'state': 'in_progress',
+                    'fingerprint': fingerprint,
+                    'createdAt': now,
+                    'lockedUntil': locked_until,
+                })
+                return None
+            except DuplicateKeyError:
+                raise IdempotencyConflict(key)
+
+        if record['fingerprint'] != fingerprint:
+            raise IdempotencyKeyReused(key)
+        if record['state'] != 'completed':
+            # Only one retry wins the takeover of an expired lease
+            claimed = await self.collection.find_one_and_update(
+                {'_id': key, 'state': 'in_progress', 'lockedUntil': {'$not': {'$gte': now}}},
+                {'$set': {'lockedUntil': locked_until}}
+            )
+            if claimed is None:
+                raise IdempotencyConflict(key)
+            return None
+        self._remember(key, record)
+        return record
+
+    async def complete(self, key: str, status_code: int, response):
+        record_update = {'state': 'completed', 'statusCode': status_code, 'response': response}
+        record = await self.collection.find_one_and_update(
+            {'_id': key}, {'$set': record_update}, return_document=ReturnDocument.AFTER
+        )
+        if record:
+            self._remember(key, record)
+
+    async def release(self, key: str):
+        """
+        Forget a claimed key after a failed request so the client can retry it
+        """
+        self._cache.pop(key, None)
+        await self.collection.delete_one({'_id': key, 'state': 'in_progress'})
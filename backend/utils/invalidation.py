@@ -0,0 +1,182 @@
+import asyncio
+import logging
+import os
+import socket
+from datetime import datetime, timezone
+from typing import List, Literal
+from pydantic import BaseModel, Field
+from pymongo import CursorType, ReturnDocument
+from pymongo.errors import CollectionInvalid
+
+logger = logging.getLogger(__name__)
+
+Topic = Literal['products', 'users', 'config', 'orders']
+
+class InvalidationEvent(BaseModel):
+    """
+    One cache invalidation. An empty keys list means "drop everything for the topic".
+    """
+    topic: Topic
+    keys: List[str] = Field(default_factory=list)
+    origin: str
+    seq: int = 0
+    publishedAt: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+class InvalidationBus:
+    """
+    Tells every worker, on every host, to evict in-process state after a write.
+
+    Events are appended to a small capped collection and delivered by one of:
+      - "tail": a tailable cursor on the capped collection (works on standalone)
+      - "change_stream": a change stream on it (replica sets)
+      - "poll": a query for newer sequence numbers every poll_interval seconds
+    The publishing worker evicts immediately and ignores its own event when it
+    comes back round.
+    """
+    REORDER_WINDOW = 100
+
+    def __init__(self, db, source: str = 'tail', collection: str = 'invalidations', poll_interval: float = 1.0, size_bytes: int = 1024 * 1024):
+        self.db = db
+        self.source = source
+        self.collection_name = collection
+        self.poll_interval = poll_interval
+        self.size_bytes = size_bytes
+        self.origin = f"{socket.gethostname()}:{os.getpid()}"
+        self.handlers = {}
+        self.stats = {}
+        self._last_seq = 0
+        self._recent = set()
+        self._task = None
+
+    @property
+    def collection(self):
+        return self.db[self.collection_name]
+
+    def subscribe(self, topic: str, handler):
+        """
+        Register handler(keys) to evict local state when topic changes anywhere
+        """
+        self.handlers.setdefault(topic, []).append(handler)
+
+    def _topic_stats(self, topic: str) -> dict:
+        return self.stats.setdefault(topic, {
+            'published': 0, 'received': 0, 'handlerFailures': 0,
+            'lastDelayMs': None, 'maxDelayMs': 0, 'totalDelayMs': 0,
+        })
+
+    def _apply(self, event: InvalidationEvent):
+        for handler in self.handlers.get(event.topic, []):
+            try:
+                handler(event.keys)
+            except Exception as e:
+                self._topic_stats(event.topic)['handlerFailures'] += 1
+                logger.warning(f"Invalidation handler for {event.topic} failed: {str(e)}")
+
+    def _deliver(self, document: dict):
+        if document.get('seed') or document['seq'] in self._recent:
+            return
+        event = InvalidationEvent(**{key: value for key, value in document.items() if key != '_id'})
+        self._recent.add(event.seq)
+        if event.seq > self._last_seq:
+            self._last_seq = event.seq
+            # Tail and change stream listeners rarely reconnect, so trim as the sequence moves
+            self._trim_recent()
+        if event.origin == self.origin:
+            return
+        published_at = event.publishedAt if event.publishedAt.tzinfo else event.publishedAt.replace(tzinfo=timezone.utc)
+        delay_ms = max((datetime.now(timezone.utc) - published_at).total_seconds() * 1000, 0)
+        stats = self._topic_stats(event.topic)
+        stats['received'] += 1
+        stats['lastDelayMs'] = delay_ms
+        stats['maxDelayMs'] = max(stats['maxDelayMs'], delay_ms)
+        stats['totalDelayMs'] += delay_ms
+        self._apply(event)
+
+    async def publish(self, topic: str, keys: List[str] = None):
+        counter = await self.db.counters.find_one_and_update(
+            {'_id': f"{self.collection_name}:seq"},
+            {'$inc': {'value': 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        event = InvalidationEvent(topic=topic, keys=keys or [], origin=self.origin, seq=counter['value'])
+        self._apply(event)
+        self._topic_stats(topic)['published'] += 1
+        await self.collection.insert_one(event.model_dump())
+
+    async def ensure_collection(self):
+        try:
+            await self.db.create_collection(self.collection_name, capped=True, size=self.size_bytes)
+            # A tailable cursor on an empty capped collection dies straight away
+            await self.collection.insert_one({'seed': True, 'seq': 0})
+        except CollectionInvalid:
+            pass
+        await self.collection.create_index('seq')
+        latest = await self.collection.find_one({}, {'_id': 0, 'seq': 1}, sort=[('seq', -1)])
+        self._last_seq = latest['seq'] if latest else 0
+        # Events from before this worker started are history, not news
+        history = await self.collection.find(self._since(), {'_id': 0, 'seq': 1}).to_list(None)
+        self._recent = {document['seq'] for document in history}
+
+    def _since(self) -> dict:
+        # Sequence numbers are taken before the insert, so concurrent publishers can
+        # land slightly out of order; re-read a short window and skip what was seen
+        self._trim_recent()
+        return {'seq': {'$gt': self._last_seq - self.REORDER_WINDOW}}
+
+    def _trim_recent(self):
+        floor = self._last_seq - self.REORDER_WINDOW
+        if len(self._recent) > 2 * self.REORDER_WINDOW:
+            self._recent = {seq for seq in self._recent if seq > floor}
+
+    async def _tail(self):
+        cursor = self.collection.find(self._since(), cursor_type=CursorType.TAILABLE_AWAIT)
+        while cursor.alive:
+            async for document in cursor:
+                self._deliver(document)
+
+    async def _watch(self):
+        async with self.collection.watch([{'$match': {'operationType': 'insert'}}]) as stream:
+            async for change in stream:
+                self._deliver(change['fullDocument'])
+
+    async def _poll(self):
+        while True:
+            documents = await self.collection.find(self._since()).sort('seq', 1).to_list(None)
+            for document in documents:
+                self._deliver(document)
+            await asyncio.sleep(self.poll_interval)
+
+    async def _run(self):
+        listen = {'tail': self._tail, 'change_stream': self._watch, 'poll': self._poll}[self.source]
+        while True:
+            try:
+                await listen()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Invalidation bus ({self.source}) interrupted: {str(e)}")
+                # Events may have been missed while disconnected; start from a clean slate
+                for topic in self.handlers:
+                    self._apply(InvalidationEvent(topic=topic, origin=self.origin))
+            await asyncio.sleep(self.poll_interval)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def metrics(self) -> dict:
+        return {
+            'source': self.source,
+            'origin': self.origin,
+            'lastSeq': self._last_seq,
+            'topics': {
+                topic: {**stats, 'avgDelayMs': stats['totalDelayMs'] / stats['received'] if stats['received'] else None}
+                for topic, stats in self.stats.items()
+            },
+        }
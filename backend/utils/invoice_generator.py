@@ -63,7 +63,7 @@ def generate_invoice_pdf(order_data: dict, user_data: dict, items_data: list, fi
     
     # Invoice details table
     invoice_details_data = [
-        ['Invoice No:', order_data['id'][:8].upper(), 'Date:', datetime.fromisoformat(order_data['createdAt']).strftime('%d-%b-%Y')],
+        ['Invoice No:', order_data.get('invoiceNumber') or order_data['id'][:8].upper(), 'Date:', datetime.fromisoformat(order_data['createdAt']).strftime('%d-%b-%Y')],
         ['Customer Type:', user_data['role'].capitalize(), 'Payment Method:', order_data['paymentMethod'].upper()],
     ]
     
@@ -0,0 +1,93 @@
+import asyncio
+from datetime import datetime, timezone
+from pymongo import ReturnDocument
+
+def financial_year(when: datetime = None) -> str:
+    """
+    Indian financial year label (April to March), e.g. 2026-27
+    """
+    when = when or datetime.now(timezone.utc)
+    start = when.year if when.month >= 4 else when.year - 1
+    return f"{start}-{(start + 1) % 100:02d}"
+
+def invoice_file_name(invoice_number: str) -> str:
+    return f"invoice_{invoice_number.replace('/', '_')}.pdf"
+
+class InvoiceNumberAllocator:
+    """
+    Sequential invoice numbers per financial year (hi/lo allocation).
+
+    Each worker reserves a block of numbers with one atomic $inc on the year's
+    counter document and hands them out locally, so bulk invoicing does not
+    serialize on the counter. Unused numbers are returned to the counter's
+    "spares" list on shutdown (or when an issued number is discarded) and are
+    handed out again before any new block, so the series stays gap-free as long
+    as workers shut down gracefully: the unused part of a block reserved by a
+    worker that crashes or is killed is lost, leaving a gap in the series.
+    """
+    def __init__(self, collection, block_size: int = 20, prefix: str = 'CEM'):
+        self.collection = collection
+        self.block_size = block_size
+        self.prefix = prefix
+        self._blocks = {}
+        self._locks = {}
+
+    def format(self, year: str, number: int) -> str:
+        return f"{self.prefix}/{year}/{number:06d}"
+
+    async def _reserve(self, year: str) -> list:
+        key = f"invoice:{year}"
+        spare = await self.collection.find_one_and_update(
+            {'_id': key, 'spares.0': {'$exists': True}},
+            {'$pop': {'spares': -1}},
+            projection={'spares': {'$slice': 1}},
+            return_document=ReturnDocument.BEFORE
+        )
+        if spare:
+            block = spare['spares'][0]
+            return [block['start'], block['end']]
+
+        counter = await self.collection.find_one_and_update(
+            {'_id': key},
+            {'$inc': {'value': self.block_size}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return [counter['value'] - self.block_size + 1, counter['value']]
+
+    async def allocate(self, when: datetime = None) -> str:
+        """
+        Next invoice number for the financial year containing `when`
+        """
+        year = financial_year(when)
+        lock = self._locks.setdefault(year, asyncio.Lock())
+        async with lock:
+            block = self._blocks.get(year)
+            if block is None or block[0] > block[1]:
+                block = self._blocks[year] = await self._reserve(year)
+            number = block[0]
+            block[0] += 1
+        return self.format(year, number)
+
+    async def give_back(self, invoice_number: str):
+        """
+        Return a single issued number that ended up unused
+        """
+        _, year, number = invoice_number.rsplit('/', 2)
+        await self.collection.update_one(
+            {'_id': f"invoice:{year}"},
+            {'$push': {'spares': {'start': int(number), 'end': int(number)}}}
+        )
+
+    async def release(self):
+        """
+        Return the unused part of every reserved block to the shared counter
+        """
+        for year, lock in list(self._locks.items()):
+            async with lock:
+                block = self._blocks.pop(year, None)
+                if block and block[0] <= block[1]:
+                    await self.collection.update_one(
+                        {'_id': f"invoice:{year}"},
+                        {'$push': {'spares': {'start': block[0], 'end': block[1]}}}
+                    )
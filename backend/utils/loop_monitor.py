@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+def route_label(route) -> str:
+    methods = ','.join(sorted(getattr(route, 'methods', None) or []))
+    return f"{methods} {route.path}".strip()
+
+class LoopLagMonitor:
+    """
+    Measures event-loop scheduling delay and reports what blocked the loop.
+
+    A heartbeat coroutine sleeps for a fixed interval and records how late it
+    wakes up. A watchdog thread notices when the heartbeat has stopped ticking,
+    grabs the loop thread's stack while the blocking call is still running and
+    attributes it to the route whose endpoint is on that stack. When the loop
+    comes back the stall is logged and counted per route.
+    """
+    def __init__(self, threshold_ms: float = 100, interval: float = 0.05, stack_limit: int = 12, history: int = 50):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval
+        self.stack_limit = stack_limit
+        self.routes = {}
+        self.stalls = deque(maxlen=history)
+        self.by_route = {}
+        self.samples = 0
+        self.max_lag_ms = 0
+        self.total_lag_ms = 0
+        self._beats = 0
+        self._last_beat = time.perf_counter()
+        self._capture = None
+        self._loop_thread = None
+        self._task = None
+        self._watchdog = None
+        self._stopped = threading.Event()
+
+    def register_routes(self, routes):
+        """
+        Map endpoint code objects to route labels for attribution
+        """
+        for route in routes:
+            endpoint = getattr(route, 'endpoint', None)
+            code = getattr(endpoint, '__code__', None)
+            if code is not None:
+                self.routes[code] = route_label(route)
+
+    def _resolve(self, frame):
+        stack = traceback.extract_stack(frame)[-self.stack_limit:]
+        route = None
+        while frame is not None:
+            route = self.routes.get(frame.f_code)
+            if route:
+                break
+            frame = frame.f_back
+        return {'route': route or 'unknown', 'stack': traceback.format_list(stack)}
+
+    def _watch(self):
+        while not self._stopped.wait(self.interval):
+            beats = self._beats
+            if time.perf_counter() - self._last_beat < self.interval + self.threshold:
+                continue
+            if self._capture is not None and self._capture['beat'] == beats:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is not None:
+                self._capture = {'beat': beats, **self._resolve(frame)}
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            self._record(max(now - expected, 0))
+            self._last_beat = now
+            self._beats += 1
+
+    def _record(self, lag: float):
+        lag_ms = lag * 1000
+        self.samples += 1
+        self.total_lag_ms += lag_ms
+        self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+        if lag < self.threshold:
+            return
+
+        capture = self._capture if self._capture and self._capture['beat'] == self._beats else None
+        route = capture['route'] if capture else 'unknown'
+        stack = capture['stack'] if capture else []
+        stats = self.by_route.setdefault(route, {'count': 0, 'totalMs': 0, 'maxMs': 0})
+        stats['count'] += 1
+        stats['totalMs'] += lag_ms
+        stats['maxMs'] = max(stats['maxMs'], lag_ms)
+        self.stalls.append({'route': route, 'lagMs': lag_ms, 'at': time.time(), 'stack': stack})
+        logger.warning(f"Event loop blocked for {lag_ms:.0f}ms in {route}\n{''.join(stack)}")
+
+    def start(self):
+        self._loop_thread = threading.get_ident()
+        self._last_beat = time.perf_counter()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name='loop-lag-watchdog', daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def metrics(self) -> dict:
+        return {
+            'thresholdMs': self.threshold * 1000,
+            'samples': self.samples,
+            'maxLagMs': self.max_lag_ms,
+            'avgLagMs': self.total_lag_ms / self.samples if self.samples else None,
+            'stalls': sum(stats['count'] for stats in self.by_route.values()),
+            'byRoute': self.by_route,
+            'recent': list(self.stalls),
+        }
@@ -0,0 +1,69 @@
+import asyncio
+import time
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+
+STATS_COLLECTIONS = ('orders', 'orders_archive', 'users', 'carts', 'products', 'request_orders', 'idempotency_keys')
+
+def cart_expiry(ttl_days: int) -> datetime:
+    """
+    When a cart touched now should be dropped by the TTL index
+    """
+    return datetime.now(timezone.utc) + timedelta(days=ttl_days)
+
+async def ensure_maintenance_indexes(db):
+    await db.carts.create_index('expiresAt', expireAfterSeconds=0)
+    await db.carts.create_index('userId')
+    for orders in (db.orders, db.orders_archive):
+        await orders.create_index('invoicePath', sparse=True)
+
+async def backfill_cart_expiry(db, ttl_days: int) -> int:
+    """
+    Give carts written before expiry existed an expiresAt based on updatedAt
+    """
+    last_touched = {'$dateFromString': {'dateString': '$updatedAt', 'onError': '$$NOW', 'onNull': '$$NOW'}}
+    result = await db.carts.update_many(
+        {'expiresAt': {'$exists': False}},
+        [{'$set': {'expiresAt': {'$add': [last_touched, ttl_days * 86400 * 1000]}}}]
+    )
+    return result.modified_count
+
+async def remove_orphaned_invoices(db, invoice_dir: str, grace_seconds: float = 86400, batch_size: int = 500) -> int:
+    """
+    Delete invoice PDFs that no live or archived order points to
+    """
+    directory = Path(invoice_dir)
+    if not directory.exists():
+        return 0
+    cutoff = time.time() - grace_seconds
+    files = await asyncio.to_thread(
+        lambda: [str(path) for path in directory.glob('*.pdf') if path.stat().st_mtime < cutoff]
+    )
+
+    removed = 0
+    for start in range(0, len(files), batch_size):
+        batch = files[start:start + batch_size]
+        referenced = set()
+        for orders in (db.orders, db.orders_archive):
+            found = await orders.find({'invoicePath': {'$in': batch}}, {'_id': 0, 'invoicePath': 1}).to_list(None)
+            referenced.update(order['invoicePath'] for order in found)
+        orphans = [path for path in batch if path not in referenced]
+        await asyncio.to_thread(lambda: [Path(path).unlink(missing_ok=True) for path in orphans])
+        removed += len(orphans)
+    return removed
+
+async def collection_stats(db, names=STATS_COLLECTIONS) -> dict:
+    stats = {}
+    for name in names:
+        try:
+            result = await db.command('collStats', name)
+        except Exception:
+            continue
+        stats[name] = {
+            'count': result.get('count', 0),
+            'size': result.get('size', 0),
+            'storageSize': result.get('storageSize', 0),
+            'totalIndexSize': result.get('totalIndexSize', 0),
+            'indexes': result.get('nindexes', 0),
+        }
+    return stats
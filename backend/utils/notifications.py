@@ -3,9 +3,12 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
 from email import encoders
+import logging
 import urllib.parse
 from config import COMPANY_CONFIG
 
+logger = logging.getLogger(__name__)
+
 def send_email_notification(to_email: str, subject: str, body: str, attachment_path: str = None):
     """
     Send email notification using Gmail SMTP
@@ -38,12 +41,11 @@ def send_email_notification(to_email: str, subject: str, body: str, attachment_p
         
         # Note: This requires SMTP credentials to be configured
         # For development, we'll just return success
-        print(f"Email notification prepared for: {to_email}")
-        print(f"Subject: {subject}")
+        logger.info("Email notification prepared", extra={'to': to_email, 'subject': subject})
         return True
         
     except Exception as e:
-        print(f"Email error: {str(e)}")
+        logger.warning(f"Email error: {str(e)}", extra={'to': to_email})
         return False
 
 def generate_whatsapp_link(phone_number: str, message: str) -> str:
@@ -174,4 +176,30 @@ Website: www.cemention.com
         """
     }
     
-    return messages.get(event, '')
\ No newline at end of file
+    return messages.get(event, '')
+
+def create_dispatch_manifest_message(vehicle: dict, orders: list, users: dict) -> str:
+    """
+    Create the delivery manifest sent to a driver for one dispatch trip
+    """
+    stops = []
+    for idx, order in enumerate(orders, 1):
+        user = users.get(order['userId'], {})
+        addr = order['deliveryAddress']
+        bags = sum(item['quantity'] for item in order['items'])
+        stops.append(f"""{idx}. Order {order['id'][:8].upper()} - {bags} bags
+{user.get('name', '')} ({user.get('phone', '')})
+{addr.get('street', '')}, {addr.get('city', '')} - {addr.get('pincode', '')}""")
+    
+    stops_text = '\n\n'.join(stops)
+    return f"""
+*Dispatch Manifest 🚚*
+
+*DRIVER: {vehicle['driverName'].upper()}*
+*VEHICLE: {vehicle['vehicleNumber']}*
+Stops: {len(orders)}
+
+{stops_text}
+
+For queries: {COMPANY_CONFIG['phone']}
+        """
@@ -0,0 +1,130 @@
+import logging
+import uuid
+from datetime import datetime, timezone, timedelta
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+# Orders that can no longer change
+CLOSED_ORDER_QUERY = {"paymentStatus": "received", "deliveryStatus": "delivered"}
+ARCHIVE_STATS_ID = "archived_orders"
+
+async def ensure_archive_indexes(db):
+    await db.orders_archive.create_index("id", unique=True)
+    await db.orders_archive.create_index([("userId", ASCENDING), ("createdAt", DESCENDING)])
+    await db.orders_archive.create_index("createdAt")
+    await db.orders_archive.create_index("statsPending", sparse=True)
+    await db.orders_archive.create_index("statsBatch", sparse=True)
+
+async def find_order(db, order_id: str, projection: dict = None):
+    """
+    Look an order up in the live collection, falling back to the archive
+    """
+    projection = projection or {"_id": 0}
+    order = await db.orders.find_one({"id": order_id}, projection)
+    if order is None:
+        order = await db.orders_archive.find_one({"id": order_id}, projection)
+    return order
+
+async def find_orders(db, query: dict, limit: int) -> list:
+    """
+    Live orders first; the archive is only read when the live page is not full
+    """
+    orders = await db.orders.find(query, {"_id": 0}).to_list(limit)
+    if len(orders) < limit:
+        archived = await db.orders_archive.find(query, {"_id": 0}).sort("createdAt", DESCENDING).to_list(limit - len(orders))
+        orders.extend(archived)
+    return orders
+
+async def get_archive_stats(db) -> dict:
+    return await db.order_stats.find_one({"_id": ARCHIVE_STATS_ID}, {"_id": 0}) or {}
+
+async def _apply_archive_stats(db, batch_id: str) -> int:
+    """
+    Add the totals of the archived orders claimed by batch_id to order_stats, once
+    """
+    orders = await db.orders_archive.find(
+        {"statsBatch": batch_id}, {"_id": 0, "userId": 1, "totalAmount": 1, "gstAmount": 1}
+    ).to_list(None)
+    if orders:
+        users = await db.users.find({"id": {"$in": list({order["userId"] for order in orders})}}, {"_id": 0, "id": 1, "role": 1}).to_list(None)
+        roles = {user["id"]: user["role"] for user in users}
+        inc = {"orders": 0, "revenue": 0, "gstOrders": 0, "nonGstOrders": 0}
+        for order in orders:
+            inc["orders"] += 1
+            inc["revenue"] += order["totalAmount"]
+            inc["gstOrders" if order.get("gstAmount", 0) > 0 else "nonGstOrders"] += 1
+            role = roles.get(order["userId"])
+            if role:
+                inc[f"roleSales.{role}"] = inc.get(f"roleSales.{role}", 0) + order["totalAmount"]
+        try:
+            # The batch id goes in with the totals, so a batch is never added twice
+            await db.order_stats.update_one(
+                {"_id": ARCHIVE_STATS_ID, "appliedBatches": {"$ne": batch_id}},
+                {"$inc": inc, "$push": {"appliedBatches": {"$each": [batch_id], "$slice": -100}}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            pass  # Already applied by an earlier or concurrent run
+    await db.orders_archive.update_many({"statsBatch": batch_id}, {"$unset": {"statsPending": "", "statsBatch": ""}})
+    return len(orders)
+
+async def _count_archived(db, order_ids: list = None) -> int:
+    """
+    Claim archived copies whose live order is really gone and add them to the totals
+    """
+    query = {"statsPending": True, "statsBatch": {"$exists": False}}
+    if order_ids is not None:
+        query["id"] = {"$in": order_ids}
+    pending = [order["id"] for order in await db.orders_archive.find(query, {"_id": 0, "id": 1}).to_list(None)]
+    if not pending:
+        return 0
+    live = {order["id"] for order in await db.orders.find({"id": {"$in": pending}}, {"_id": 0, "id": 1}).to_list(None)}
+    gone = [order_id for order_id in pending if order_id not in live]
+    if not gone:
+        return 0
+    # Only one run can claim an order, however many saw it go
+    batch_id = str(uuid.uuid4())
+    await db.orders_archive.update_many({**query, "id": {"$in": gone}}, {"$set": {"statsBatch": batch_id}})
+    return await _apply_archive_stats(db, batch_id)
+
+async def archive_closed_orders(db, older_than_days: int, batch_size: int = 500, on_archived=None) -> int:
+    """
+    Move closed orders older than the cutoff into orders_archive, keeping running
+    analytics totals for them in order_stats. on_archived(order_ids) is awaited
+    after each batch, e.g. to drop the orders from in-memory indexes.
+
+    Archived copies are flagged statsPending until their totals are counted, and
+    an order is only counted once its live copy is gone and a run has claimed it.
+    Overlapping runs therefore never count an order twice, and a run interrupted
+    at any step is completed by the next one.
+    """
+    # Finish whatever an interrupted run left claimed or uncounted
+    for batch_id in await db.orders_archive.distinct("statsBatch", {"statsBatch": {"$exists": True}}):
+        await _apply_archive_stats(db, batch_id)
+    archived = await _count_archived(db)
+
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=older_than_days)).isoformat()
+    query = {**CLOSED_ORDER_QUERY, "createdAt": {"$lt": cutoff}}
+
+    while True:
+        orders = await db.orders.find(query, {"_id": 0}).limit(batch_size).to_list(batch_size)
+        if not orders:
+            return archived
+        order_ids = [order["id"] for order in orders]
+
+        await db.orders_archive.bulk_write(
+            [UpdateOne({"id": order["id"]}, {"$set": order, "$setOnInsert": {"statsPending": True}}, upsert=True) for order in orders],
+            ordered=False
+        )
+        await db.orders.delete_many({"id": {"$in": order_ids}, **CLOSED_ORDER_QUERY})
+
+        # Orders reopened since they were read stay live; drop their uncounted copies
+        reopened = await db.orders.find({"id": {"$in": order_ids}, "$nor": [CLOSED_ORDER_QUERY]}, {"_id": 0, "id": 1}).to_list(None)
+        if reopened:
+            await db.orders_archive.delete_many({"id": {"$in": [order["id"] for order in reopened]}, "statsPending": True, "statsBatch": {"$exists": False}})
+            logger.warning(f"{len(reopened)} orders changed while being archived and were left live")
+        archived += await _count_archived(db, order_ids)
+        if on_archived is not None:
+            await on_archived(order_ids)
@@ -0,0 +1,89 @@
+import asyncio
+import json
+import logging
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# Order fields whose changes are pushed to subscribers
+ORDER_STATE_FIELDS = (
+    'paymentStatus', 'transactionId', 'status', 'deliveryStatus',
+    'driverName', 'driverMobile', 'vehicleNumber', 'invoicePath'
+)
+
+class OrderEventBroker:
+    """
+    In-process pub/sub for order state deltas. Each subscriber gets a bounded
+    queue; a slow subscriber loses its oldest events instead of blocking publishers.
+    """
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self._subscribers = set()
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def publish(self, event: dict):
+        for queue in self._subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+def order_event(order_id: str, user_id: str, changes: dict) -> dict:
+    """
+    Build an order delta event from the changed fields
+    """
+    return {
+        'type': 'order.updated',
+        'orderId': order_id,
+        'userId': user_id,
+        'changes': {field: value for field, value in changes.items() if field in ORDER_STATE_FIELDS},
+        'at': datetime.now(timezone.utc).isoformat(),
+    }
+
+def format_sse(event: dict) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+async def stream_order_events(broker: OrderEventBroker, request, user_id: str = None, heartbeat: float = 15):
+    """
+    Server-Sent Events generator; user_id limits the stream to that user's orders
+    """
+    queue = broker.subscribe()
+    try:
+        yield "retry: 3000\n\n"
+        while not await request.is_disconnected():
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            if user_id is None or event['userId'] == user_id:
+                yield format_sse(event)
+    finally:
+        broker.unsubscribe(queue)
+
+async def watch_order_changes(db, broker: OrderEventBroker):
+    """
+    Feed the broker from a MongoDB change stream so every worker sees updates
+    made by the others. Requires a replica set.
+    """
+    pipeline = [{'$match': {'operationType': 'update'}}]
+    while True:
+        try:
+            async with db.orders.watch(pipeline, full_document='updateLookup') as stream:
+                async for change in stream:
+                    order = change.get('fullDocument') or {}
+                    changes = change['updateDescription']['updatedFields']
+                    event = order_event(order.get('id'), order.get('userId'), changes)
+                    if event['changes']:
+                        broker.publish(event)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Order change stream interrupted: {str(e)}")
+            await asyncio.sleep(5)
@@ -0,0 +1,246 @@
+import sys
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+
+ORDER_INDEX_PROJECTION = {'_id': 0, 'id': 1, 'userId': 1, 'status': 1, 'paymentStatus': 1, 'deliveryStatus': 1, 'totalAmount': 1, 'createdAt': 1}
+
+# Facet label of missing values; filtering on it selects them (code 0)
+MISSING_LABEL = 'none'
+
+# Columns holding interned strings, and the order field each one is read from
+CODED_COLUMNS = ('status', 'paymentStatus', 'deliveryStatus', 'role', 'userId')
+SORT_COLUMNS = {'createdAt': 'created', 'totalAmount': 'amount'}
+
+class StringPool:
+    """
+    Interns repeated strings as small integer codes; code 0 is None/missing
+    """
+    def __init__(self):
+        self.values = [None]
+        self.codes = {None: 0}
+
+    def code(self, value) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def lookup(self, value) -> int:
+        return self.codes.get(value, -1)
+
+def created_ms(created_at) -> int:
+    if not created_at:
+        return 0
+    when = created_at if isinstance(created_at, datetime) else datetime.fromisoformat(created_at)
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return int(when.timestamp() * 1000)
+
+class OrderIndex:
+    """
+    Column-per-field copy of the live orders the admin panel filters on.
+
+    Status-like strings and user ids are interned into integer codes, amounts
+    and creation times are float64/int64 arrays, and a row is found by order id
+    through a dict. Filters are boolean masks over the columns, so filter, count,
+    sort and page queries never touch MongoDB; only the page's documents are
+    fetched afterwards. Removed orders are tombstoned and dropped on rebuild.
+
+    A rebuild loads a fresh index off the event loop while this one keeps
+    serving. Writes made in the meantime are journaled from start_journal() and
+    replayed onto the fresh index by adopt(), so none are lost in the swap.
+    """
+    def __init__(self, capacity: int = 1024):
+        self.pools = {column: StringPool() for column in CODED_COLUMNS}
+        self.ids = []
+        self.rows = {}
+        self._allocate(capacity)
+        self.size = 0
+        self.built_at = None
+        self._journal = None
+
+    def _allocate(self, capacity: int):
+        self.codes = {column: np.zeros(capacity, dtype=np.int32 if column == 'userId' else np.int16) for column in CODED_COLUMNS}
+        self.amount = np.zeros(capacity, dtype=np.float64)
+        self.created = np.zeros(capacity, dtype=np.int64)
+        self.alive = np.zeros(capacity, dtype=bool)
+
+    def _grow(self, needed: int):
+        capacity = len(self.alive)
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity * 2)
+        self.codes = {column: np.resize(array, capacity) for column, array in self.codes.items()}
+        self.amount = np.resize(self.amount, capacity)
+        self.created = np.resize(self.created, capacity)
+        self.alive = np.resize(self.alive, capacity)
+        self.alive[self.size:] = False
+
+    def load(self, orders: list, roles: dict):
+        """
+        Replace the index contents with the given orders, column-wise
+        """
+        frame = pd.DataFrame(orders, columns=list(ORDER_INDEX_PROJECTION)[1:])
+        self.pools = {column: StringPool() for column in CODED_COLUMNS}
+        self._allocate(max(len(frame) * 2, 1024))
+        self.size = len(frame)
+        self.ids = frame['id'].tolist()
+        self.rows = {order_id: row for row, order_id in enumerate(self.ids)}
+
+        frame['role'] = frame['userId'].map(roles)
+        for column in CODED_COLUMNS:
+            # Intern each distinct value once; missing values factorize to -1 and map to code 0
+            factorized, uniques = pd.factorize(frame[column])
+            lookup = np.array([0] + [self.pools[column].code(value) for value in uniques], dtype=np.int32)
+            self.codes[column][:self.size] = lookup[factorized + 1]
+        self.amount[:self.size] = pd.to_numeric(frame['totalAmount'], errors='coerce').fillna(0).to_numpy()
+        created = pd.to_datetime(frame['createdAt'], utc=True, errors='coerce', format='ISO8601')
+        # The parsed resolution depends on the input (pandas picks us for ISO strings), so pin it
+        self.created[:self.size] = created.dt.as_unit('ms').astype('int64').where(created.notna(), 0).to_numpy()
+        self.alive[:self.size] = True
+        self.built_at = datetime.now(timezone.utc).isoformat()
+
+    def start_journal(self):
+        """
+        Record writes from now on, to replay them onto an index being built
+        """
+        self._journal = []
+
+    def stop_journal(self):
+        self._journal = None
+
+    def _record(self, method: str, *args):
+        if self._journal is not None:
+            self._journal.append((method, args))
+
+    def adopt(self, other: 'OrderIndex'):
+        """
+        Take over the contents of an index built elsewhere (e.g. in a worker
+        thread), replaying the writes journaled here since the build started
+        """
+        journal, self._journal = self._journal or [], None
+        other._journal = None
+        for method, args in journal:
+            getattr(other, method)(*args)
+        self.__dict__.update(other.__dict__)
+
+    def latest_created(self) -> int:
+        """
+        Creation time (epoch ms) of the newest indexed order, 0 when empty
+        """
+        return int(self.created[:self.size].max()) if self.size else 0
+
+    def upsert(self, order: dict, role: str = None):
+        self._record('upsert', order, role)
+        row = self.rows.get(order['id'])
+        if row is None:
+            self._grow(self.size + 1)
+            row = self.rows[order['id']] = self.size
+            self.ids.append(order['id'])
+            self.size += 1
+        values = {**{column: order.get(column) for column in CODED_COLUMNS}, 'role': role}
+        for column, value in values.items():
+            self.codes[column][row] = self.pools[column].code(value)
+        self.amount[row] = order.get('totalAmount') or 0
+        self.created[row] = created_ms(order.get('createdAt'))
+        self.alive[row] = True
+
+    def apply_changes(self, order_id: str, changes: dict):
+        """
+        Apply an order event's changed fields to the order's row, if indexed
+        """
+        self._record('apply_changes', order_id, changes)
+        row = self.rows.get(order_id)
+        if row is None:
+            return
+        for column in ('status', 'paymentStatus', 'deliveryStatus'):
+            if column in changes:
+                self.codes[column][row] = self.pools[column].code(changes[column])
+
+    def remove(self, order_ids):
+        order_ids = list(order_ids)
+        self._record('remove', order_ids)
+        for order_id in order_ids:
+            row = self.rows.get(order_id)
+            if row is not None:
+                self.alive[row] = False
+
+    def set_user_role(self, user_id: str, role: str):
+        self._record('set_user_role', user_id, role)
+        user_code = self.pools['userId'].lookup(user_id)
+        if user_code > 0:
+            matches = self.codes['userId'][:self.size] == user_code
+            self.codes['role'][:self.size][matches] = self.pools['role'].code(role)
+
+    def _mask(self, filters: dict, created_from: int = None, created_to: int = None) -> np.ndarray:
+        mask = self.alive[:self.size].copy()
+        for column, wanted in filters.items():
+            if not wanted:
+                continue
+            column_codes = self.codes[column][:self.size]
+            codes = [0 if value == MISSING_LABEL else self.pools[column].lookup(value) for value in wanted]
+            codes = [code for code in codes if code >= 0]
+            if len(codes) <= 8:
+                # A few vectorized comparisons are much cheaper than np.isin here
+                hits = np.zeros(self.size, dtype=bool)
+                for code in codes:
+                    hits |= column_codes == code
+            else:
+                allowed = np.zeros(len(self.pools[column].values), dtype=bool)
+                allowed[codes] = True
+                hits = np.take(allowed, column_codes)
+            mask &= hits
+        if created_from is not None:
+            mask &= self.created[:self.size] >= created_from
+        if created_to is not None:
+            mask &= self.created[:self.size] < created_to
+        return mask
+
+    def _facet(self, rows: np.ndarray, column: str) -> dict:
+        pool = self.pools[column]
+        counts = np.bincount(self.codes[column][rows], minlength=len(pool.values))
+        return {pool.values[code] or MISSING_LABEL: int(count) for code, count in enumerate(counts) if count}
+
+    def query(self, filters: dict = None, created_from: int = None, created_to: int = None, sort: str = '-createdAt', skip: int = 0, limit: int = 50) -> dict:
+        """
+        Order ids for one page of the filtered, sorted set, with the total and
+        per-status counts of the whole filtered set. filters maps a coded column
+        to the values to keep, e.g. {"status": ["pending", "confirmed"]}.
+        """
+        mask = self._mask(filters or {}, created_from, created_to)
+        rows = np.flatnonzero(mask)
+        descending = sort.startswith('-')
+        key = getattr(self, SORT_COLUMNS.get(sort.lstrip('-'), 'created'))[rows]
+        end = skip + limit
+        if descending:
+            key = -key
+        if end < len(rows):
+            # Only the rows up to the requested page need to be in order
+            nearest = np.argpartition(key, end - 1)[:end]
+            order = nearest[np.argsort(key[nearest], kind='stable')]
+        else:
+            order = np.argsort(key, kind='stable')
+        page = rows[order[skip:end]]
+        return {
+            'total': int(len(rows)),
+            'ids': [self.ids[row] for row in page],
+            'facets': {column: self._facet(rows, column) for column in ('status', 'paymentStatus', 'deliveryStatus', 'role')},
+        }
+
+    def memory(self) -> dict:
+        arrays = [*self.codes.values(), self.amount, self.created, self.alive]
+        column_bytes = sum(array.nbytes for array in arrays)
+        id_bytes = sys.getsizeof(self.ids) + sys.getsizeof(self.rows) + sum(sys.getsizeof(order_id) for order_id in self.ids)
+        # Per order: one slot in every column plus its id string and lookup entries
+        per_row = sum(array.itemsize for array in arrays) + (id_bytes / self.size if self.size else 0)
+        return {
+            'rows': self.size,
+            'liveRows': int(self.alive[:self.size].sum()),
+            'capacity': len(self.alive),
+            'columnBytes': int(column_bytes),
+            'idBytes': int(id_bytes),
+            'bytesPer100kOrders': int(per_row * 100_000),
+            'builtAt': self.built_at,
+        }
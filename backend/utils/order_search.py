@@ -0,0 +1,98 @@
+import asyncio
+import re
+from pymongo import ASCENDING, DESCENDING, TEXT, UpdateOne
+
+SEARCH_USER_PROJECTION = {"_id": 0, "id": 1, "name": 1, "phone": 1, "businessName": 1}
+
+def phone_digits(phone: str) -> str:
+    """
+    Phone number reduced to its 10 national digits for prefix search
+    """
+    digits = ''.join(filter(str.isdigit, phone or ''))
+    if len(digits) > 10 and digits.startswith('91'):
+        digits = digits[2:]
+    return digits
+
+def user_search_fields(user: dict) -> dict:
+    """
+    Normalized copies of the fields admins search customers by
+    """
+    return {
+        "phoneDigits": phone_digits(user.get("phone")),
+        "businessNameLower": (user.get("businessName") or "").strip().lower(),
+    }
+
+async def ensure_search_indexes(db):
+    for orders in (db.orders, db.orders_archive):
+        await orders.create_index("invoiceNumber")
+        await orders.create_index([("userId", ASCENDING), ("createdAt", DESCENDING)])
+    await db.orders.create_index("id")
+    await db.users.create_index("id")
+    await db.users.create_index("email")
+    await db.users.create_index("phoneDigits")
+    await db.users.create_index("businessNameLower")
+    await db.users.create_index([("name", TEXT)])
+
+async def backfill_search_fields(db, batch_size: int = 500):
+    """
+    Fill search fields on documents written before they existed
+    """
+    # Invoices rendered before sequential numbering printed the order id prefix
+    legacy_number = [{"$set": {"invoiceNumber": {"$toUpper": {"$substrCP": ["$id", 0, 8]}}}}]
+    for orders in (db.orders, db.orders_archive):
+        await orders.update_many({"invoiceNumber": None, "invoicePath": {"$ne": None}}, legacy_number)
+
+    while True:
+        users = await db.users.find({"phoneDigits": {"$exists": False}}, {"_id": 0, "id": 1, "phone": 1, "businessName": 1}).to_list(batch_size)
+        if not users:
+            return
+        await db.users.bulk_write([UpdateOne({"id": user["id"]}, {"$set": user_search_fields(user)}) for user in users], ordered=False)
+
+async def _find_users(db, query: str, limit: int) -> list:
+    lookups = [db.users.find({"businessNameLower": {"$regex": f"^{re.escape(query.lower())}"}}, SEARCH_USER_PROJECTION).limit(limit).to_list(limit)]
+    digits = phone_digits(query)
+    if len(digits) >= 3 and not re.search(r"[a-zA-Z]", query):
+        lookups.append(db.users.find({"phoneDigits": {"$regex": f"^{digits}"}}, SEARCH_USER_PROJECTION).limit(limit).to_list(limit))
+    lookups.append(db.users.find({"$text": {"$search": query}}, SEARCH_USER_PROJECTION).limit(limit).to_list(limit))
+
+    users = {}
+    for found in await asyncio.gather(*lookups):
+        for user in found:
+            users.setdefault(user["id"], user)
+    return list(users.values())
+
+async def search_orders(db, query: str, limit: int = 20) -> list:
+    """
+    Orders matching an invoice-number or order-id prefix, a customer phone or
+    business-name prefix, or words in the customer's name. Every lookup is
+    index-backed.
+    """
+    query = query.strip()
+    if not query:
+        return []
+
+    users = await _find_users(db, query, limit)
+    users_by_id = {user["id"]: user for user in users}
+
+    criteria = [{"invoiceNumber": {"$regex": f"^{re.escape(query.upper())}"}}]
+    # Customers also quote the order id prefix from their WhatsApp messages
+    if re.fullmatch(r"[0-9a-fA-F]{1,8}", query):
+        criteria.append({"id": {"$regex": f"^{query.lower()}"}})
+    if users_by_id:
+        criteria.append({"userId": {"$in": list(users_by_id)}})
+
+    projection = {"_id": 0, "items": 0}
+    orders = []
+    for collection in (db.orders, db.orders_archive):
+        found = await collection.find({"$or": criteria}, projection).sort("createdAt", DESCENDING).limit(limit - len(orders)).to_list(limit)
+        orders.extend(found)
+        if len(orders) >= limit:
+            break
+
+    missing = list({order["userId"] for order in orders} - set(users_by_id))
+    if missing:
+        for user in await db.users.find({"id": {"$in": missing}}, SEARCH_USER_PROJECTION).to_list(None):
+            users_by_id[user["id"]] = user
+    for order in orders:
+        order["customer"] = users_by_id.get(order["userId"])
+    return orders
@@ -0,0 +1,170 @@
+import asyncio
+import cProfile
+import io
+import json
+import pstats
+import random
+import time
+import uuid
+from contextvars import ContextVar
+from pathlib import Path
+from jose import JWTError, jwt
+from pymongo import monitoring
+
+# Set only while a profiled request is running
+_active_profile = ContextVar('active_profile', default=None)
+
+class MongoCommandRecorder(monitoring.CommandListener):
+    """
+    Records the MongoDB commands issued by a profiled request. Motor copies the
+    request's context into its executor threads, so the ContextVar is visible here.
+    """
+    def started(self, event):
+        profile = _active_profile.get()
+        if profile is not None:
+            collection = event.command.get(event.command_name)
+            profile['pending'][event.request_id] = {
+                'command': event.command_name,
+                'collection': collection if isinstance(collection, str) else None,
+            }
+
+    def succeeded(self, event):
+        self._finish(event, 'ok')
+
+    def failed(self, event):
+        self._finish(event, 'failed')
+
+    def _finish(self, event, outcome):
+        profile = _active_profile.get()
+        if profile is not None:
+            command = profile['pending'].pop(event.request_id, {'command': event.command_name, 'collection': None})
+            profile['commands'].append({**command, 'durationMs': event.duration_micros / 1000, 'outcome': outcome})
+
+class ProfiledDatabase:
+    """
+    Database handle that sends the commands of a profiled request through a
+    second client carrying the MongoCommandRecorder. Unprofiled requests use the
+    plain client, so command monitoring costs them nothing.
+    """
+    def __init__(self, database, profiled_database):
+        self._database = database
+        self._profiled_database = profiled_database
+
+    def _target(self):
+        return self._database if _active_profile.get() is None else self._profiled_database
+
+    def __getattr__(self, name):
+        return getattr(self._target(), name)
+
+    def __getitem__(self, name):
+        return self._target()[name]
+
+def _header(scope, name: bytes):
+    for key, value in scope['headers']:
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+class ProfilingMiddleware:
+    """
+    Runs opted-in API requests under cProfile. Admins opt in with an
+    "X-Profile: 1" header; sample_rate profiles a random share of all requests.
+    Everything else goes straight through. cProfile sees the whole event loop, so
+    only one request is profiled at a time and concurrent work shows up in it.
+    """
+    def __init__(self, app, secret_key: str, algorithm: str, output_dir: str, sample_rate: float = 0.0):
+        self.app = app
+        self.secret_key = secret_key
+        self.algorithm = algorithm
+        self.output_dir = Path(output_dir)
+        self.sample_rate = sample_rate
+        self._lock = asyncio.Lock()
+
+    def _is_admin(self, scope) -> bool:
+        authorization = _header(scope, b'authorization') or ''
+        if not authorization.lower().startswith('bearer '):
+            return False
+        try:
+            payload = jwt.decode(authorization[7:], self.secret_key, algorithms=[self.algorithm])
+        except JWTError:
+            return False
+        return payload.get('role') == 'admin'
+
+    def _wants_profile(self, scope) -> bool:
+        if scope['type'] != 'http' or not scope['path'].startswith('/api/') or self._lock.locked():
+            return False
+        if _header(scope, b'x-profile') == '1':
+            return self._is_admin(scope)
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if not self._wants_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex
+
+        async def send_with_profile_id(message):
+            if message['type'] == 'http.response.start':
+                message['headers'] = list(message.get('headers', [])) + [(b'x-profile-id', profile_id.encode())]
+            await send(message)
+
+        async with self._lock:
+            profile = {'commands': [], 'pending': {}}
+            token = _active_profile.set(profile)
+            profiler = cProfile.Profile()
+            started = time.perf_counter()
+            profiler.enable()
+            try:
+                await self.app(scope, receive, send_with_profile_id)
+            finally:
+                profiler.disable()
+                _active_profile.reset(token)
+                duration_ms = (time.perf_counter() - started) * 1000
+                await asyncio.to_thread(self._save, profile_id, profiler, scope, duration_ms, profile['commands'])
+
+    def _save(self, profile_id, profiler, scope, duration_ms, commands):
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(self.output_dir / f'{profile_id}.pstats')
+        (self.output_dir / f'{profile_id}.json').write_text(json.dumps({
+            'id': profile_id,
+            'method': scope['method'],
+            'path': scope['path'],
+            'durationMs': duration_ms,
+            'createdAt': time.time(),
+            'commands': commands,
+        }))
+
+def prune_profiles(output_dir: str, keep_seconds: float = 7 * 86400, keep_count: int = 500) -> int:
+    """
+    Delete profiles older than keep_seconds, and the oldest beyond keep_count
+    """
+    paths = sorted(Path(output_dir).glob('*.json'), key=lambda p: p.stat().st_mtime, reverse=True)
+    cutoff = time.time() - keep_seconds
+    expired = [path for index, path in enumerate(paths) if index >= keep_count or path.stat().st_mtime < cutoff]
+    for path in expired:
+        path.with_suffix('.pstats').unlink(missing_ok=True)
+        path.unlink(missing_ok=True)
+    return len(expired)
+
+def list_profiles(output_dir: str, limit: int = 100) -> list:
+    paths = sorted(Path(output_dir).glob('*.json'), key=lambda p: p.stat().st_mtime, reverse=True)[:limit]
+    profiles = []
+    for path in paths:
+        profile = json.loads(path.read_text())
+        profile['commandCount'] = len(profile.pop('commands'))
+        profiles.append(profile)
+    return profiles
+
+def load_profile(output_dir: str, profile_id: str, top: int = 40):
+    """
+    Profile metadata, Motor commands and the top functions by cumulative time
+    """
+    path = Path(output_dir) / f'{profile_id}.json'
+    if not path.exists():
+        return None
+    profile = json.loads(path.read_text())
+    stream = io.StringIO()
+    pstats.Stats(str(Path(output_dir) / f'{profile_id}.pstats'), stream=stream).sort_stats('cumulative').print_stats(top)
+    profile['stats'] = stream.getvalue()
+    return profile
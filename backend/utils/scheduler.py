@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import os
+import random
+import socket
+import time
+from datetime import datetime, timezone, timedelta
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+class MaintenanceScheduler:
+    """
+    Runs periodic maintenance jobs inside the app's event loop.
+
+    Intervals are jittered so workers started together do not run in lockstep.
+    A job marked leader_only runs on one worker at a time: before each run the
+    worker must hold a lease in the locks collection, renewed on every run and
+    taken over by another worker once it expires.
+    """
+    def __init__(self, locks_collection, owner: str = None):
+        self.locks = locks_collection
+        self.owner = owner or worker_id()
+        self.jobs = {}
+        self._tasks = []
+
+    def add_job(self, name: str, interval_seconds: float, func, jitter: float = 0.1, leader_only: bool = True, lock_name: str = None):
+        self.jobs[name] = {
+            'name': name,
+            'interval': interval_seconds,
+            'func': func,
+            'jitter': jitter,
+            'leader_only': leader_only,
+            'lock': lock_name or f"job:{name}",
+            # The lease only keeps other workers out; this keeps a manual run and a scheduled one apart
+            'running': asyncio.Lock(),
+            'metrics': {
+                'runs': 0, 'failures': 0, 'skipped': 0,
+                'lastStartedAt': None, 'lastDurationMs': None, 'maxDurationMs': 0, 'totalDurationMs': 0,
+                'lastResult': None, 'lastError': None,
+            },
+        }
+
+    async def _acquire(self, job) -> bool:
+        now = datetime.now(timezone.utc)
+        # The lease outlives one interval so the leader keeps it between runs
+        expires_at = now + timedelta(seconds=job['interval'] * (2 + job['jitter']))
+        try:
+            await self.locks.update_one(
+                {'_id': job['lock'], '$or': [{'owner': self.owner}, {'expiresAt': {'$lt': now}}]},
+                {'$set': {'owner': self.owner, 'expiresAt': expires_at}},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            return False
+
+    async def run_job(self, name: str):
+        """
+        Run a job once now, honouring its lease; returns the job's result
+        """
+        job = self.jobs[name]
+        async with job['running']:
+            return await self._run(job)
+
+    async def _run(self, job):
+        name = job['name']
+        metrics = job['metrics']
+        if job['leader_only'] and not await self._acquire(job):
+            metrics['skipped'] += 1
+            return None
+
+        metrics['lastStartedAt'] = datetime.now(timezone.utc).isoformat()
+        started = time.perf_counter()
+        try:
+            result = await job['func']()
+            metrics['lastResult'] = result
+            metrics['lastError'] = None
+            return result
+        except Exception as e:
+            metrics['failures'] += 1
+            metrics['lastError'] = str(e)
+            logger.warning(f"Maintenance job {name} failed: {str(e)}")
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            metrics['runs'] += 1
+            metrics['lastDurationMs'] = duration_ms
+            metrics['totalDurationMs'] += duration_ms
+            metrics['maxDurationMs'] = max(metrics['maxDurationMs'], duration_ms)
+
+    async def _loop(self, job):
+        await asyncio.sleep(random.uniform(0, job['interval'] * job['jitter']))
+        while True:
+            await self.run_job(job['name'])
+            await asyncio.sleep(job['interval'] * random.uniform(1 - job['jitter'], 1 + job['jitter']))
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._loop(job)) for job in self.jobs.values()]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.locks.delete_many({'owner': self.owner})
+
+    def metrics(self) -> dict:
+        return {
+            name: {
+                'interval': job['interval'],
+                'leaderOnly': job['leader_only'],
+                **job['metrics'],
+                'avgDurationMs': job['metrics']['totalDurationMs'] / job['metrics']['runs'] if job['metrics']['runs'] else None,
+            }
+            for name, job in self.jobs.items()
+        }
@@ -0,0 +1,18 @@
+import asyncio
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls by key: while a call for a key is running,
+    later callers await the same result instead of starting their own.
+    """
+    def __init__(self):
+        self._calls = {}
+
+    async def do(self, key, func):
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        # One caller going away must not cancel the work the others wait on
+        return await asyncio.shield(task)
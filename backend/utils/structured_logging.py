@@ -0,0 +1,180 @@
+import copy
+import json
+import logging
+import queue
+import random
+import sys
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# Fields of the request being served; a dict so code deeper in the request can add to it
+_log_context = ContextVar('log_context', default=None)
+
+CONTEXT_FIELDS = ('requestId', 'userId', 'route')
+
+# Server loggers that come with their own handlers; they are sent through the queue too
+SERVER_LOGGERS = ('uvicorn', 'uvicorn.error')
+# uvicorn's access log duplicates RequestLogMiddleware's "access" records
+SILENCED_LOGGERS = ('uvicorn.access',)
+
+def bind_log_context(**fields):
+    """
+    Attach fields (e.g. userId) to every log record for the rest of the request
+    """
+    context = _log_context.get()
+    if context is not None:
+        context.update(fields)
+
+class RequestContextFilter(logging.Filter):
+    def filter(self, record):
+        context = _log_context.get() or {}
+        if context and not context.get('route'):
+            # The router stores the matched route in the scope once it has run
+            route = context['scope'].get('route')
+            context['route'] = getattr(route, 'path', None)
+        for field in CONTEXT_FIELDS:
+            if not hasattr(record, field):
+                setattr(record, field, context.get(field))
+        return True
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line, with request context and any `extra` fields
+    """
+    RESERVED = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in self.RESERVED and value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Hands records to the listener thread and never waits: when the queue is
+    full the record is dropped and counted instead of blocking the event loop
+    """
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self.traceback_formatter = logging.Formatter()
+
+    def prepare(self, record):
+        # The base class folds the traceback into the message and drops exc_info;
+        # keep it as a separate "exception" field of the JSON line instead
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.traceback_formatter.formatException(record.exc_info)
+        record.exception = record.exc_text
+        record.stack = record.stack_info
+        record.msg, record.args = record.message, None
+        record.exc_info = record.exc_text = record.stack_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+def setup_logging(level: int = logging.INFO, queue_size: int = 10000) -> QueueListener:
+    """
+    Route all logging through a bounded queue to a JSON stream handler running
+    on its own thread. Returns the started listener; stop it on shutdown.
+
+    uvicorn configures its loggers before the app is imported, with their own
+    stream handlers and propagate=False, so they are re-pointed at the root here.
+    """
+    log_queue = queue.Queue(maxsize=queue_size)
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter())
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    for name in SERVER_LOGGERS + SILENCED_LOGGERS:
+        server_logger = logging.getLogger(name)
+        server_logger.handlers.clear()
+        server_logger.propagate = name in SERVER_LOGGERS
+        server_logger.disabled = name in SILENCED_LOGGERS
+
+    listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    return listener
+
+def dropped_log_records() -> int:
+    return sum(getattr(handler, 'dropped', 0) for handler in logging.getLogger().handlers)
+
+def parse_sample_rates(value: str) -> dict:
+    """
+    "/api/products=0.05,/api/config=0.01" -> {"/api/products": 0.05, "/api/config": 0.01}
+    """
+    rates = {}
+    for part in (value or '').split(','):
+        route, _, rate = part.partition('=')
+        if route.strip() and rate.strip():
+            rates[route.strip()] = float(rate)
+    return rates
+
+class RequestLogMiddleware:
+    """
+    Gives every request an id (X-Request-ID is honoured and echoed back) and
+    writes one access record with route, status and duration. High-volume
+    routes can be sampled; errors and slow requests are always logged.
+    """
+    def __init__(self, app, sample_rates: dict = None, slow_ms: float = 1000, logger_name: str = 'access'):
+        self.app = app
+        self.sample_rates = sample_rates or {}
+        self.slow_ms = slow_ms
+        self.logger = logging.getLogger(logger_name)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for key, value in scope['headers']:
+            if key == b'x-request-id':
+                request_id = value.decode('latin-1')[:64]
+        context = {'requestId': request_id or uuid.uuid4().hex, 'userId': None, 'route': None, 'scope': scope}
+        token = _log_context.set(context)
+        status_code = 500
+
+        async def send_with_request_id(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+                message['headers'] = list(message.get('headers', [])) + [(b'x-request-id', context['requestId'].encode())]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            context['route'] = getattr(scope.get('route'), 'path', None) or scope['path']
+            rate = self.sample_rates.get(context['route'], 1.0)
+            if status_code >= 500 or duration_ms >= self.slow_ms or rate >= 1 or random.random() < rate:
+                self.logger.info(
+                    f"{scope['method']} {scope['path']} {status_code}",
+                    extra={'method': scope['method'], 'path': scope['path'], 'status': status_code, 'durationMs': round(duration_ms, 2), 'sampleRate': rate}
+                )
+            _log_context.reset(token)
@@ -0,0 +1,113 @@
+import asyncio
+import sys
+from datetime import timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+from utils.analytics_snapshot import AnalyticsSnapshot
+
+
+def matches(document, query):
+    for field, condition in query.items():
+        if field == '$or':
+            if not any(matches(document, part) for part in condition):
+                return False
+            continue
+        value = document.get(field)
+        if not isinstance(condition, dict):
+            if value != condition:
+                return False
+            continue
+        for operator, operand in condition.items():
+            if operator == '$in' and value not in operand:
+                return False
+            if operator in ('$gt', '$gte') and (value is None or value < operand or (operator == '$gt' and value == operand)):
+                return False
+    return True
+
+
+class Cursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    async def to_list(self, length):
+        return list(self.documents)
+
+
+class Collection:
+    def __init__(self, documents=None):
+        self.documents = documents or []
+
+    def find(self, query, projection=None):
+        return Cursor([document for document in self.documents if matches(document, query)])
+
+
+class Database:
+    def __init__(self, orders):
+        self.orders = Collection(orders)
+        self.orders_archive = Collection()
+        self.users = Collection([{'id': 'u1', 'role': 'dealer'}])
+
+
+def order(order_id, created_at, quantity=100, payment_status='received'):
+    return {
+        'id': order_id,
+        'userId': 'u1',
+        'items': [{'brand': 'UltraTech', 'grade': 'OPC 53', 'quantity': quantity, 'price': 400.0}],
+        'gstAmount': 0,
+        'paymentStatus': payment_status,
+        'deliveryAddress': {'city': 'Pune'},
+        'createdAt': created_at,
+    }
+
+
+def test_late_inserted_order_inside_lookback_is_picked_up(tmp_path):
+    db = Database([order('a', '2026-01-10T10:00:00+00:00'), order('c', '2026-01-10T10:05:00+00:00')])
+    snapshot = AnalyticsSnapshot(tmp_path)
+
+    async def scenario():
+        await snapshot.refresh(db)
+        # Stamped before 'c' but committed after the first refresh
+        db.orders.documents.append(order('b', '2026-01-10T10:02:00+00:00'))
+        return await snapshot.refresh(db)
+
+    rows = asyncio.run(scenario())
+
+    frame = snapshot.load()
+    assert rows == 3
+    assert sorted(frame['orderId'].astype(str)) == ['a', 'b', 'c']
+    assert snapshot._read_meta(snapshot._current_version())['highWaterMark'] == '2026-01-10T10:05:00+00:00'
+
+
+def test_reread_orders_replace_their_rows(tmp_path):
+    db = Database([order('a', '2026-01-10T10:00:00+00:00', quantity=100)])
+    snapshot = AnalyticsSnapshot(tmp_path)
+
+    async def scenario():
+        await snapshot.refresh(db)
+        await snapshot.refresh(db)
+        return await snapshot.refresh(db)
+
+    rows = asyncio.run(scenario())
+
+    # Orders inside the lookback window are read every run but never duplicated
+    assert rows == 1
+    assert int(snapshot.load()['quantity'].sum()) == 100
+
+
+def test_paid_closed_and_old_orders_leave_the_open_set(tmp_path):
+    db = Database([
+        order('paid', '2026-01-10T10:00:00+00:00'),
+        order('unpaid', '2026-01-10T10:00:00+00:00', payment_status='pending'),
+        {**order('cancelled', '2026-01-10T10:00:00+00:00', payment_status='pending'), 'status': 'cancelled'},
+        order('stale', '2020-01-10T10:00:00+00:00', payment_status='pending'),
+    ])
+    snapshot = AnalyticsSnapshot(tmp_path, open_max_age=timedelta(days=3650))
+
+    asyncio.run(snapshot.refresh(db))
+    assert snapshot._read_meta(snapshot._current_version())['openOrderIds'] == ['unpaid', 'stale']
+
+    snapshot.open_max_age = timedelta(days=365)
+    asyncio.run(snapshot.refresh(db))
+    assert snapshot._read_meta(snapshot._current_version())['openOrderIds'] == ['unpaid']
@@ -0,0 +1,79 @@
+import io
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+from utils.bulk_import import ImportFormatError, catalog_frame, read_chunks, validate_chunk
+
+CATALOG = catalog_frame([
+    {'id': 'p1', 'brand': 'UltraTech', 'grade': 'OPC 53', 'basePrice': 400.0},
+    {'id': 'p2', 'brand': 'ACC', 'grade': 'PPC', 'basePrice': 350.0},
+])
+
+
+def sheet(rows, start=0):
+    frame = pd.DataFrame(rows, dtype=object)
+    frame.index = pd.RangeIndex(start, start + len(frame))
+    return frame
+
+
+def test_valid_rows_are_matched_and_priced():
+    chunk = sheet([
+        {'Product ID': 'p1', 'Qty': '100', 'Order Ref': 'A'},
+        {'Brand': ' ultratech ', 'Grade': 'opc 53', 'Qty': '150', 'Order Ref': 'B'},
+    ])
+    lines, errors = validate_chunk(chunk, CATALOG, 0.9)
+
+    assert errors == []
+    assert lines['productId'].tolist() == ['p1', 'p1']
+    assert lines['quantity'].tolist() == [100, 150]
+    assert lines['price'].tolist() == [360.0, 360.0]
+
+
+def test_quantity_errors_use_the_cart_rules():
+    chunk = sheet([
+        {'productId': 'p1', 'quantity': '50'},
+        {'productId': 'p1', 'quantity': '120'},
+        {'productId': 'p1', 'quantity': 'ten'},
+        {'productId': 'p1', 'quantity': '100.5'},
+    ])
+    lines, errors = validate_chunk(chunk, CATALOG, 1.0)
+
+    assert lines.empty
+    assert [error['errors'] for error in errors] == [
+        ['Minimum order quantity is 100 bags'],
+        ['Quantity must be in multiples of 50 or 100'],
+        ['Quantity must be a whole number'],
+        ['Quantity must be a whole number'],
+    ]
+
+
+def test_unknown_product_errors_are_combined_and_numbered_as_in_the_sheet():
+    # Second chunk of a sheet: data rows 5000+ sit on spreadsheet rows 5002+ (row 1 is the header)
+    chunk = sheet([
+        {'productId': 'p2', 'quantity': '200'},
+        {'productId': 'nope', 'quantity': '200'},
+        {'productId': 'nope', 'quantity': '30'},
+    ], start=5000)
+    lines, errors = validate_chunk(chunk, CATALOG, 1.0)
+
+    assert lines.index.tolist() == [5000]
+    assert errors == [
+        {'row': 5003, 'errors': ['Unknown product']},
+        {'row': 5004, 'errors': ['Minimum order quantity is 100 bags', 'Unknown product']},
+    ]
+
+
+def test_missing_columns_are_a_format_error():
+    with pytest.raises(ImportFormatError):
+        validate_chunk(sheet([{'productId': 'p1'}]), CATALOG, 1.0)
+
+
+def test_corrupt_workbook_is_a_format_error():
+    pytest.importorskip('openpyxl')
+    with pytest.raises(ImportFormatError):
+        list(read_chunks(io.BytesIO(b'not a zip file'), 'orders.xlsx'))
@@ -0,0 +1,54 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+from utils.dispatch_planner import plan_dispatch
+
+
+def order(order_id, bags, city, pincode):
+    return {
+        'id': order_id,
+        'items': [{'quantity': bags}],
+        'deliveryAddress': {'city': city, 'pincode': pincode},
+    }
+
+
+def vehicle(number, capacity):
+    return {'vehicleNumber': number, 'capacity': capacity, 'driverName': number, 'driverMobile': '9000000000'}
+
+
+def test_orders_are_packed_by_city_within_capacity():
+    orders = [
+        order('a', 300, 'Pune', '411001'),
+        order('b', 200, 'Pune', '411001'),
+        order('c', 100, 'Pune', '411002'),
+        order('d', 250, 'Nashik', '422001'),
+    ]
+    trips, unassigned = plan_dispatch(orders, [vehicle('big', 600), vehicle('van-1', 300), vehicle('van-2', 300)])
+
+    assert unassigned == []
+    loads = {tuple(sorted(o['id'] for o in trip['orders'])): trip['load'] for trip in trips}
+    # Largest Pune order fills a van; the rest of Pune shares the second van
+    assert loads == {('a',): 300, ('b', 'c'): 300, ('d',): 250}
+    nashik = next(trip for trip in trips if trip['city'] == 'nashik')
+    assert nashik['vehicle']['vehicleNumber'] == 'big'
+    # A vehicle never carries more than it can, nor two cities
+    for trip in trips:
+        assert trip['load'] <= trip['vehicle']['capacity']
+        assert len({o['deliveryAddress']['city'] for o in trip['orders']}) == 1
+
+
+def test_order_larger_than_any_vehicle_is_unassigned():
+    trips, unassigned = plan_dispatch([order('huge', 1000, 'Pune', '411001')], [vehicle('small', 300)])
+
+    assert trips == []
+    assert unassigned == [{'orderId': 'huge', 'bags': 1000, 'reason': 'No vehicle with enough capacity'}]
+
+
+def test_a_second_city_does_not_share_a_loaded_vehicle():
+    orders = [order('a', 100, 'Pune', '411001'), order('b', 100, 'Nashik', '422001')]
+    trips, unassigned = plan_dispatch(orders, [vehicle('only', 600)])
+
+    assert [o['id'] for o in trips[0]['orders']] == ['a'] or [o['id'] for o in trips[0]['orders']] == ['b']
+    assert len(unassigned) == 1
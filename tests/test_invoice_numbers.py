@@ -0,0 +1,88 @@
+import asyncio
+import random
+import sys
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+from utils.invoice_numbers import InvoiceNumberAllocator, financial_year
+
+
+class FakeCounters:
+    """
+    Just enough of a Motor collection for the allocator: each call yields to the
+    event loop before applying its update atomically, like a real round trip.
+    """
+    def __init__(self):
+        self.docs = {}
+
+    async def find_one_and_update(self, query, update, projection=None, upsert=False, return_document=None):
+        await asyncio.sleep(random.random() / 1000)
+        doc = self.docs.get(query['_id'])
+        if doc is None and not upsert:
+            return None
+        if 'spares.0' in query and not (doc and doc.get('spares')):
+            return None
+        doc = self.docs.setdefault(query['_id'], {'_id': query['_id'], 'value': 0, 'spares': []})
+        before = {'_id': doc['_id'], 'value': doc['value'], 'spares': list(doc['spares'])}
+        if '$inc' in update:
+            doc['value'] += update['$inc']['value']
+        if '$pop' in update:
+            doc['spares'].pop(0)
+        return before if return_document is False else doc
+
+    async def update_one(self, query, update):
+        await asyncio.sleep(0)
+        doc = self.docs.setdefault(query['_id'], {'_id': query['_id'], 'value': 0, 'spares': []})
+        doc['spares'].append(update['$push']['spares'])
+
+
+def serial(invoice_number):
+    return int(invoice_number.rsplit('/', 1)[1])
+
+
+def test_financial_year_starts_in_april():
+    assert financial_year(datetime(2026, 3, 31)) == '2025-26'
+    assert financial_year(datetime(2026, 4, 1)) == '2026-27'
+    assert financial_year(datetime(2099, 12, 1)) == '2099-00'
+
+
+def test_concurrent_allocation_has_no_gaps_or_duplicates():
+    async def scenario():
+        counters = FakeCounters()
+        workers = [InvoiceNumberAllocator(counters, block_size=7) for _ in range(4)]
+        when = datetime(2026, 6, 1)
+
+        issued = await asyncio.gather(*[random.choice(workers).allocate(when) for _ in range(250)])
+        assert len(set(issued)) == len(issued)
+        assert all(number.startswith('CEM/2026-27/') for number in issued)
+
+        # Workers shut down with partly used blocks; a new worker drains the spares
+        for worker in workers:
+            await worker.release()
+        spare_count = sum(s['end'] - s['start'] + 1 for s in counters.docs['invoice:2026-27']['spares'])
+        successor = InvoiceNumberAllocator(counters, block_size=7)
+        issued += [await successor.allocate(when) for _ in range(spare_count)]
+
+        serials = sorted(serial(number) for number in issued)
+        assert serials == list(range(1, len(serials) + 1))
+        assert counters.docs['invoice:2026-27']['spares'] == []
+
+    asyncio.run(scenario())
+
+
+def test_given_back_number_is_reissued():
+    async def scenario():
+        counters = FakeCounters()
+        allocator = InvoiceNumberAllocator(counters, block_size=3)
+        when = datetime(2026, 6, 1)
+        first = await allocator.allocate(when)
+        await allocator.give_back(first)
+        await allocator.release()
+
+        successor = InvoiceNumberAllocator(counters, block_size=3)
+        reissued = [await successor.allocate(when) for _ in range(3)]
+        assert sorted(map(serial, reissued)) == [1, 2, 3]
+
+    asyncio.run(scenario())
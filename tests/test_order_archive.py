@@ -0,0 +1,195 @@
+import asyncio
+import sys
+from pathlib import Path
+
+from pymongo.errors import DuplicateKeyError
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+from utils.order_archive import ARCHIVE_STATS_ID, archive_closed_orders
+
+
+def matches(document, query):
+    for field, condition in query.items():
+        if field == '$nor':
+            if any(matches(document, part) for part in condition):
+                return False
+            continue
+        value = document.get(field)
+        if not isinstance(condition, dict):
+            if value != condition:
+                return False
+            continue
+        for operator, operand in condition.items():
+            if operator == '$in' and value not in operand:
+                return False
+            if operator == '$ne' and (operand in value if isinstance(value, list) else value == operand):
+                return False
+            if operator == '$exists' and (field in document) != operand:
+                return False
+            if operator == '$lt' and not (value is not None and value < operand):
+                return False
+    return True
+
+
+class Cursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def limit(self, count):
+        return Cursor(self.documents[:count])
+
+    async def to_list(self, length):
+        # Yield like a real round trip, so concurrent runs interleave
+        await asyncio.sleep(0)
+        return [dict(document) for document in self.documents]
+
+
+class Result:
+    def __init__(self, deleted_count=0):
+        self.deleted_count = deleted_count
+
+
+class Collection:
+    def __init__(self, documents=None):
+        self.documents = documents or []
+
+    def find(self, query, projection=None):
+        return Cursor([document for document in self.documents if matches(document, query)])
+
+    async def distinct(self, field, query):
+        return list(dict.fromkeys(document[field] for document in self.documents if matches(document, query)))
+
+    def _update(self, document, update):
+        for field, value in update.get('$set', {}).items():
+            document[field] = value
+        for field in update.get('$unset', {}):
+            document.pop(field, None)
+        for field, value in update.get('$inc', {}).items():
+            parent, _, key = field.rpartition('.')
+            target = document.setdefault(parent, {}) if parent else document
+            target[key] = target.get(key, 0) + value
+        for field, value in update.get('$push', {}).items():
+            document[field] = (document.get(field, []) + value['$each'])[value['$slice']:]
+
+    async def update_one(self, query, update, upsert=False):
+        await asyncio.sleep(0)
+        for document in self.documents:
+            if matches(document, query):
+                self._update(document, update)
+                return
+        if upsert:
+            if any(document.get('_id') == query.get('_id') for document in self.documents):
+                raise DuplicateKeyError('duplicate _id')
+            document = {'_id': query['_id']}
+            self._update(document, update)
+            self.documents.append(document)
+
+    async def update_many(self, query, update):
+        await asyncio.sleep(0)
+        for document in self.documents:
+            if matches(document, query):
+                self._update(document, update)
+
+    async def bulk_write(self, operations, ordered=True):
+        await asyncio.sleep(0)
+        for operation in operations:
+            query, update = operation._filter, operation._doc
+            existing = next((document for document in self.documents if matches(document, query)), None)
+            if existing is None:
+                existing = dict(query)
+                self._update(existing, {'$set': update.get('$setOnInsert', {})})
+                self.documents.append(existing)
+            self._update(existing, {'$set': update['$set']})
+
+    async def delete_many(self, query):
+        await asyncio.sleep(0)
+        kept = [document for document in self.documents if not matches(document, query)]
+        deleted, self.documents = len(self.documents) - len(kept), kept
+        return Result(deleted)
+
+
+class Database:
+    def __init__(self, orders):
+        self.orders = Collection(orders)
+        self.orders_archive = Collection()
+        self.order_stats = Collection()
+        self.users = Collection([{'id': 'u1', 'role': 'dealer'}])
+
+
+def closed_order(order_id, amount):
+    return {
+        'id': order_id, 'userId': 'u1', 'totalAmount': amount, 'gstAmount': 0,
+        'paymentStatus': 'received', 'deliveryStatus': 'delivered', 'createdAt': '2020-01-01T00:00:00+00:00',
+    }
+
+
+def stats(db):
+    return next(document for document in db.order_stats.documents if document['_id'] == ARCHIVE_STATS_ID)
+
+
+def test_overlapping_runs_count_each_order_once():
+    db = Database([closed_order(f'o{i}', 100.0) for i in range(5)])
+
+    async def scenario():
+        return await asyncio.gather(archive_closed_orders(db, 30, batch_size=2), archive_closed_orders(db, 30, batch_size=2))
+
+    counts = asyncio.run(scenario())
+
+    assert sum(counts) == 5
+    assert db.orders.documents == []
+    assert len(db.orders_archive.documents) == 5
+    assert stats(db)['orders'] == 5
+    assert stats(db)['revenue'] == 500.0
+    assert stats(db)['roleSales'] == {'dealer': 500.0}
+
+
+def test_reopened_order_stays_live_and_uncounted():
+    db = Database([closed_order('a', 100.0), closed_order('b', 200.0)])
+    delete_many = db.orders.delete_many
+
+    async def reopen_then_delete(query):
+        # 'b' is reopened between the read and the delete
+        db.orders.documents[1]['deliveryStatus'] = 'dispatched'
+        return await delete_many(query)
+
+    db.orders.delete_many = reopen_then_delete
+    archived = asyncio.run(archive_closed_orders(db, 30))
+
+    assert archived == 1
+    assert [order['id'] for order in db.orders.documents] == ['b']
+    assert [order['id'] for order in db.orders_archive.documents] == ['a']
+    assert stats(db)['orders'] == 1
+
+
+def test_interrupted_run_is_completed_by_the_next():
+    db = Database([closed_order('a', 100.0)])
+    update_many = db.orders_archive.update_many
+
+    async def crash_on_claim(query, update):
+        raise RuntimeError('worker killed')
+
+    db.orders_archive.update_many = crash_on_claim
+    try:
+        asyncio.run(archive_closed_orders(db, 30))
+    except RuntimeError:
+        pass
+    # The live copy is gone but nothing was counted yet
+    assert db.orders.documents == [] and db.order_stats.documents == []
+
+    db.orders_archive.update_many = update_many
+    assert asyncio.run(archive_closed_orders(db, 30)) == 1
+    assert asyncio.run(archive_closed_orders(db, 30)) == 0
+    assert stats(db)['orders'] == 1
+
+
+def test_each_archived_batch_is_reported():
+    db = Database([closed_order(f'o{i}', 100.0) for i in range(3)])
+    batches = []
+
+    async def on_archived(order_ids):
+        batches.append(order_ids)
+
+    asyncio.run(archive_closed_orders(db, 30, batch_size=2, on_archived=on_archived))
+
+    assert batches == [['o0', 'o1'], ['o2']]
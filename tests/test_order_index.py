@@ -0,0 +1,108 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+from utils.order_index import OrderIndex, created_ms
+
+
+def order(order_id, user_id, status, amount, day, payment_status='pending'):
+    return {
+        'id': order_id,
+        'userId': user_id,
+        'status': status,
+        'paymentStatus': payment_status,
+        'deliveryStatus': 'pending',
+        'totalAmount': amount,
+        'createdAt': f'2026-03-{day:02d}T10:00:00+00:00',
+    }
+
+
+ORDERS = [
+    order('a', 'u1', 'pending', 500.0, 1),
+    order('b', 'u2', 'confirmed', 1500.0, 2, 'received'),
+    order('c', 'u1', 'confirmed', 250.0, 3),
+    order('d', 'u3', 'cancelled', 900.0, 4),
+    order('e', 'u2', 'pending', 1200.0, 5, 'received'),
+]
+ROLES = {'u1': 'dealer', 'u2': 'contractor', 'u3': 'dealer'}
+
+
+def loaded():
+    index = OrderIndex()
+    index.load(ORDERS, ROLES)
+    return index
+
+
+def test_filters_combine_within_and_across_columns():
+    index = loaded()
+
+    result = index.query({'status': ['pending', 'confirmed'], 'role': ['dealer']})
+    assert result['ids'] == ['c', 'a']
+    assert result['total'] == 2
+    # Unknown values match nothing rather than everything
+    assert index.query({'status': ['shipped']})['total'] == 0
+    # Facets count the filtered set, not the whole index
+    assert index.query({'paymentStatus': ['received']})['facets']['status'] == {'pending': 1, 'confirmed': 1}
+
+
+def test_missing_values_filter_under_their_facet_label():
+    index = loaded()
+    index.upsert({**order('f', 'u1', 'pending', 100.0, 6), 'deliveryStatus': None}, 'dealer')
+
+    result = index.query({'deliveryStatus': ['none']})
+    assert result['ids'] == ['f']
+    assert index.query()['facets']['deliveryStatus'] == {'pending': 5, 'none': 1}
+    assert index.query({'deliveryStatus': ['none', 'pending']})['total'] == 6
+
+
+def test_created_range_is_half_open():
+    index = loaded()
+
+    result = index.query(created_from=created_ms('2026-03-02T10:00:00+00:00'), created_to=created_ms('2026-03-04T10:00:00+00:00'))
+    assert result['ids'] == ['c', 'b']
+
+
+def test_sort_and_pages():
+    index = loaded()
+
+    assert index.query(sort='totalAmount')['ids'] == ['c', 'a', 'd', 'e', 'b']
+    assert index.query(sort='-totalAmount')['ids'] == ['b', 'e', 'd', 'a', 'c']
+    # Pages that end before the last row only partially sort the set
+    pages = [index.query(sort='-createdAt', skip=skip, limit=2)['ids'] for skip in (0, 2, 4)]
+    assert pages == [['e', 'd'], ['c', 'b'], ['a']]
+    assert index.query(skip=10, limit=2) == {**index.query(skip=10, limit=2), 'total': 5, 'ids': []}
+
+
+def test_writes_update_rows_in_place():
+    index = loaded()
+
+    index.apply_changes('a', {'status': 'confirmed'})
+    index.upsert(order('f', 'u4', 'pending', 100.0, 6), 'retail')
+    index.remove(['d'])
+    index.set_user_role('u2', 'dealer')
+
+    assert index.query({'status': ['confirmed']})['ids'] == ['c', 'b', 'a']
+    assert index.query({'role': ['retail']})['ids'] == ['f']
+    assert 'd' not in index.query()['ids']
+    assert index.query({'role': ['dealer']})['total'] == 4
+    assert index.latest_created() == created_ms('2026-03-06T10:00:00+00:00')
+
+
+def test_writes_during_a_rebuild_are_replayed_on_adopt():
+    index = loaded()
+    index.start_journal()
+    # The rebuild read the collection before these writes landed
+    fresh = OrderIndex()
+    fresh.load(ORDERS, ROLES)
+    index.upsert(order('f', 'u1', 'pending', 100.0, 6), 'dealer')
+    index.apply_changes('b', {'status': 'delivered'})
+    index.remove(['d'])
+
+    index.adopt(fresh)
+
+    assert index.query()['ids'] == ['f', 'e', 'c', 'b', 'a']
+    assert index.query({'status': ['delivered']})['ids'] == ['b']
+    # Writes after the swap are no longer journaled
+    index.upsert(order('g', 'u1', 'pending', 100.0, 7), 'dealer')
+    assert index._journal is None